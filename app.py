@@ -5,11 +5,46 @@ from flask import redirect
 from schemas import *
 from flask_cors import CORS
 
-from routes import watchlist_bp, movie_bp
+import config
+from json_provider import create_json_provider
+from models import Session, query_stats
+from routes import watchlist_bp, movie_bp, metrics_bp
+from services import MovieRefresher, omdb_api
+
+
+class MyMoviesAPI(OpenAPI):
+    """Aplicação da API, com um serializador JSON configurável."""
+
+    _json = None
+
+    @property
+    def json(self):
+        """Serializador das respostas, criado no primeiro uso.
+
+        O serializador é escolhido pela configuração JSON_PROVIDER.
+        """
+        if self._json is None:
+            self._json = create_json_provider(
+                self, config.get_str("JSON_PROVIDER", "orjson")
+            )
+
+        return self._json
+
+    @json.setter
+    def json(self, provider):
+        """Troca o serializador das respostas."""
+        self._json = provider
+
+    def make_response(self, rv):
+        """Serializa as respostas em dicionário ou lista com o self.json."""
+        body, rest = (rv[0], rv[1:]) if isinstance(rv, tuple) else (rv, ())
+
+        if isinstance(body, (dict, list)):
+            response = self.json.response(body)
+            rv = (response, *rest) if rest else response
+
+        return super().make_response(rv)
 
-info = Info(title="My Movies API", version="1.0.0")
-app = OpenAPI(__name__, info=info)
-CORS(app)
 
 # definindo tags
 home_tag = Tag(
@@ -22,7 +57,6 @@ watchlist_tag = Tag(
 )
 
 
-@app.get("/", tags=[home_tag])
 def home():
     """Redireciona para /openapi.
 
@@ -31,6 +65,80 @@ def home():
     return redirect("/openapi")
 
 
-# Registra rotas
-app.register_api(watchlist_bp)
-app.register_api(movie_bp)
+def remove_session(exception=None):
+    """Encerra a sessão do banco ao fim da requisição.
+
+    A sessão só existe se a requisição acessou o banco. Em caso de erro as
+    alterações pendentes são desfeitas antes de a conexão voltar ao pool.
+    """
+    if not Session.registry.has():
+        return
+
+    if exception is not None:
+        Session.rollback()
+
+    Session.remove()
+
+
+def create_app():
+    """Cria a aplicação.
+
+    A criação não tem efeitos colaterais: a configuração é lida, o banco é
+    criado e migrado e os clientes das APIs externas são criados no
+    primeiro uso, e a atualização periódica dos filmes começa na primeira
+    requisição de cada processo. Assim a aplicação pode ser carregada antes
+    do fork dos workers (preload), que compartilham a memória do processo
+    pai e abrem as suas próprias conexões e threads.
+    """
+    info = Info(title="My Movies API", version="1.0.0")
+    app = MyMoviesAPI(__name__, info=info)
+    CORS(app)
+
+    app.get("/", tags=[home_tag])(home)
+
+    @app.after_request
+    def report_queries(response):
+        """Registra as consultas repetidas da requisição.
+
+        Em modo debug, a quantidade de consultas, o tempo gasto nelas e o
+        número de repetições da consulta mais repetida vão nos cabeçalhos.
+        """
+        summary = query_stats.report()
+
+        if app.debug:
+            response.headers["X-DB-Queries"] = str(summary["queries"])
+            response.headers["X-DB-Time"] = f"{summary['time'] * 1000:.2f}ms"
+            response.headers["X-DB-Repeated-Queries"] = str(
+                summary["repeated"]
+            )
+
+        return response
+
+    app.teardown_appcontext(remove_session)
+
+    # atualização periódica dos detalhes dos filmes guardados na base
+    movie_refresher = MovieRefresher(omdb_api)
+    app.extensions["movie_refresher"] = movie_refresher
+
+    @app.before_request
+    def start_movie_refresher():
+        """Inicia a atualização dos filmes no processo que atende o app."""
+        if movie_refresher.interval > 0:
+            movie_refresher.start()
+
+    @app.cli.command("refresh-movies")
+    def refresh_movies():
+        """Atualiza os detalhes dos filmes desatualizados na base."""
+        count = movie_refresher.refresh_stale()
+        print(f"{count} filmes atualizados")
+
+    # Registra rotas
+    app.register_api(watchlist_bp)
+    app.register_api(movie_bp)
+    app.register_api(metrics_bp)
+
+    return app
+
+
+# aplicação usada pelo flask run
+app = create_app()
@@ -0,0 +1,5 @@
+"""Benchmarks das partes mais usadas da API.
+
+Os scripts devem ser executados a partir da raiz do repositório, por
+exemplo: python -m benchmarks.suite
+"""
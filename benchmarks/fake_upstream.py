@@ -0,0 +1,279 @@
+"""Servidor local que imita o OMDb e o serviço do top 100.
+
+Uso:
+    python -m benchmarks.fake_upstream [--port 5002]
+        [--latency lognormal:80:0.5] [--error-rate 0.01]
+        [--quota 1000 --quota-window 86400]
+
+Responde como o OMDb às buscas por id (?i=) e por texto (?s=) na raiz e
+como o serviço de scraping à rota /movies. Para a API usá-lo, inicie-a
+com as variáveis:
+
+    OMDB_URL=http://localhost:5002
+    TOP100_URL=http://localhost:5002/movies
+
+A latência de cada resposta segue a distribuição informada, em
+milissegundos:
+
+    fixed:MS                  sempre a mesma espera
+    uniform:MIN:MAX           espera uniforme entre MIN e MAX
+    exponential:MEDIA         espera exponencial com a média informada
+    lognormal:MEDIANA:SIGMA   espera log-normal, com cauda longa
+
+Uma fração das respostas pode falhar com erro 500/503 (--error-rate) e,
+esgotada a cota de requisições da janela (--quota), o OMDb responde 401
+"Request limit reached!", como o plano gratuito real.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import zlib
+
+from benchmarks.json_providers import omdb_movie
+
+
+def parse_latency(spec: str):
+    """Converte a descrição da distribuição em uma função de espera.
+
+    A função retorna a espera sorteada, em segundos.
+    """
+    name, *params = spec.split(":")
+    params = [float(p) for p in params]
+
+    if name == "fixed":
+        (delay,) = params
+        return lambda: delay / 1000
+
+    if name == "uniform":
+        low, high = params
+        return lambda: random.uniform(low, high) / 1000
+
+    if name == "exponential":
+        (mean,) = params
+        return lambda: random.expovariate(1 / mean) / 1000 if mean else 0.0
+
+    if name == "lognormal":
+        median, sigma = params
+        return lambda: random.lognormvariate(math.log(median), sigma) / 1000
+
+    raise argparse.ArgumentTypeError(f"distribuição inválida: {spec}")
+
+
+class Upstream:
+    """Estado compartilhado do servidor: latência, falhas e cota."""
+
+    def __init__(
+        self,
+        latency,
+        error_rate: float = 0.0,
+        quota: int = 0,
+        quota_window: float = 86400,
+    ):
+        """Cria o estado do servidor.
+
+        Arguments:
+            latency: função que sorteia a espera de cada resposta.
+            error_rate: fração das respostas que falham com erro 5xx.
+            quota: requisições permitidas ao OMDb por janela (0 desativa).
+            quota_window: duração da janela da cota, em segundos.
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.quota = quota
+        self.quota_window = quota_window
+
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_requests = 0
+        self.requests = 0
+        self.errors = 0
+        self.quota_errors = 0
+
+    def quota_exceeded(self):
+        """Conta a requisição na janela e indica se a cota acabou."""
+        with self._lock:
+            self.requests += 1
+
+            if not self.quota:
+                return False
+
+            now = time.monotonic()
+            if now - self._window_start >= self.quota_window:
+                self._window_start = now
+                self._window_requests = 0
+
+            self._window_requests += 1
+            exceeded = self._window_requests > self.quota
+
+            if exceeded:
+                self.quota_errors += 1
+
+            return exceeded
+
+    def failed(self):
+        """Sorteia se a resposta deve falhar."""
+        failed = random.random() < self.error_rate
+
+        if failed:
+            with self._lock:
+                self.errors += 1
+
+        return failed
+
+
+def preview(movie: dict):
+    """Retorna o filme no formato de um resultado de busca."""
+    return {
+        key: movie[key]
+        for key in ("Title", "Year", "imdbID", "Type", "Poster")
+    }
+
+
+def omdb_response(params: dict):
+    """Monta a resposta do OMDb para os parâmetros da requisição."""
+    imdb_id = params.get("i")
+
+    if imdb_id is not None:
+        number = imdb_id[2:]
+
+        if not imdb_id.startswith("tt") or not number.isdigit():
+            return {"Response": "False", "Error": "Incorrect IMDb ID."}
+
+        return omdb_movie(int(number))
+
+    query = params.get("s")
+
+    if not query:
+        return {"Response": "False", "Error": "Incorrect IMDb ID."}
+
+    # a quantidade de resultados depende apenas do texto buscado
+    total = zlib.crc32(query.lower().encode()) % 300
+    page = int(params.get("page") or 1)
+    first = (page - 1) * 10
+
+    if first >= total:
+        return {"Response": "False", "Error": "Movie not found!"}
+
+    offset = zlib.crc32(query.encode()) % 1000000
+    return {
+        "Search": [
+            preview(omdb_movie(offset + i))
+            for i in range(first, min(first + 10, total))
+        ],
+        "totalResults": str(total),
+        "Response": "True",
+    }
+
+
+def top100_response():
+    """Monta a resposta do serviço de scraping do top 100."""
+    return {
+        "Search": [preview(omdb_movie(i)) for i in range(100)],
+        "totalResults": "100",
+        "Response": "True",
+    }
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Atende às requisições do OMDb e do top 100."""
+
+    upstream: Upstream = None
+
+    def do_GET(self):
+        """Responde à requisição após a latência sorteada."""
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        time.sleep(self.upstream.latency())
+
+        if url.path == "/movies":
+            self.upstream.quota_exceeded()
+            status, body = 200, top100_response()
+
+        elif self.upstream.quota_exceeded():
+            status = 401
+            body = {"Response": "False", "Error": "Request limit reached!"}
+
+        else:
+            status, body = 200, omdb_response(params)
+
+        if self.upstream.failed():
+            status = random.choice((500, 503))
+            body = {"Response": "False", "Error": "Erro simulado"}
+
+        data = json.dumps(body).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """Os acessos não são registrados, para não afetar a latência."""
+
+
+def main():
+    """Inicia o servidor."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__.split("\n\n", 1)[1],
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5002)
+    parser.add_argument(
+        "--latency",
+        type=parse_latency,
+        default="lognormal:80:0.5",
+        help="distribuição da latência das respostas, em milissegundos",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="fração das respostas que falham com erro 500 ou 503",
+    )
+    parser.add_argument(
+        "--quota",
+        type=int,
+        default=0,
+        help="requisições permitidas ao OMDb por janela (0 desativa)",
+    )
+    parser.add_argument(
+        "--quota-window",
+        type=float,
+        default=86400,
+        help="duração da janela da cota, em segundos",
+    )
+    args = parser.parse_args()
+
+    upstream = Upstream(
+        args.latency, args.error_rate, args.quota, args.quota_window
+    )
+    Handler.upstream = upstream
+
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+
+    print(f"Servidor em http://{args.host}:{args.port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(
+            f"{upstream.requests} requisições, {upstream.errors} erros "
+            f"simulados, {upstream.quota_errors} acima da cota"
+        )
+
+
+if __name__ == "__main__":
+    main()
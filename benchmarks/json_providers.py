@@ -0,0 +1,152 @@
+"""Compara os serializadores JSON das respostas da API.
+
+Uso:
+    python benchmarks/json_providers.py [--repeat 5] [--number 20]
+
+Serializa, com cada serializador, payloads equivalentes aos das rotas de
+listas e de busca de filmes e mostra o tempo médio de cada um.
+"""
+from datetime import datetime
+import argparse
+import json
+import os
+import sys
+import timeit
+
+from flask import Flask
+
+# permite importar os módulos da API a partir da raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_provider import json_providers  # noqa: E402
+
+
+def omdb_movie(i: int):
+    """Retorna um filme no formato completo do OMDb."""
+    return {
+        "Title": f"Filme número {i}",
+        "Year": str(1950 + i % 70),
+        "Rated": "PG-13",
+        "Released": "01 Jan 2000",
+        "Runtime": "120 min",
+        "Genre": "Action, Adventure, Drama",
+        "Director": "Diretor Exemplo",
+        "Writer": "Roteirista Um, Roteirista Dois",
+        "Actors": "Ator Um, Atriz Dois, Ator Três",
+        "Plot": "Uma sinopse longa o bastante para parecer real. " * 4,
+        "Language": "English, Português",
+        "Country": "United States, Brazil",
+        "Awards": "Won 3 Oscars. 120 wins & 200 nominations total",
+        "Poster": f"https://m.media-amazon.com/images/M/{i}.jpg",
+        "Ratings": [
+            {"Source": "Internet Movie Database", "Value": "8.1/10"},
+            {"Source": "Rotten Tomatoes", "Value": "91%"},
+            {"Source": "Metacritic", "Value": "80/100"},
+        ],
+        "Metascore": "80",
+        "imdbRating": "8.1",
+        "imdbVotes": "1,234,567",
+        "imdbID": f"tt{i:07d}",
+        "Type": "movie",
+        "DVD": "01 Jan 2001",
+        "BoxOffice": "$100,000,000",
+        "Production": "N/A",
+        "Website": "N/A",
+        "Response": "True",
+    }
+
+
+def watchlist(id: int, size: int):
+    """Retorna uma lista com os detalhes completos dos seus filmes."""
+    return {
+        "id": id,
+        "name": f"Lista {id}",
+        "description": "Descrição da lista",
+        "movies": [omdb_movie(i) for i in range(size)],
+    }
+
+
+def payloads():
+    """Retorna os payloads representativos de cada rota."""
+    return {
+        # GET /watchlist: várias listas com os ids dos filmes
+        "watchlists (50 x 20 ids)": {
+            "watchlists": [
+                {
+                    "id": id,
+                    "name": f"Lista {id}",
+                    "description": "Descrição da lista",
+                    "movies": [f"tt{i:07d}" for i in range(20)],
+                }
+                for id in range(50)
+            ],
+            "next": 50,
+        },
+        # GET /watchlist/<id>: os detalhes completos de cada filme
+        "watchlist (200 filmes)": watchlist(1, 200),
+        # GET /movies: uma página de resultados da busca
+        "search (10 resultados)": {
+            "Search": [
+                {
+                    key: omdb_movie(i)[key]
+                    for key in ("Title", "Year", "imdbID", "Type", "Poster")
+                }
+                for i in range(10)
+            ],
+            "totalResults": "1234",
+            "Response": "True",
+        },
+        # Watchlist.to_dict, com as datas do AddedMovie.to_dict
+        "to_dict (500 filmes)": {
+            "id": 1,
+            "name": "Lista 1",
+            "description": "Descrição da lista",
+            "movies": [
+                {
+                    "id": i,
+                    "imdb_id": f"tt{i:07d}",
+                    "created_at": datetime(2023, 1, 1, 12, 0, i % 60),
+                    "watchlist_id": 1,
+                }
+                for i in range(500)
+            ],
+        },
+    }
+
+
+def main():
+    """Executa a comparação e mostra os resultados."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    providers = {name: cls(app) for name, cls in json_providers.items()}
+
+    print(f"{'payload':<28}" + "".join(f"{n:>14}" for n in providers))
+
+    with app.app_context():
+        for label, payload in payloads().items():
+            outputs = [p.dumps(payload) for p in providers.values()]
+
+            # os serializadores devem gerar o mesmo JSON
+            assert len({json.dumps(json.loads(o)) for o in outputs}) == 1
+
+            row = f"{label:<28}"
+
+            for provider in providers.values():
+                best = min(
+                    timeit.repeat(
+                        lambda: provider.dumps(payload),
+                        repeat=args.repeat,
+                        number=args.number,
+                    )
+                )
+                row += f"{best / args.number * 1000:>11.3f} ms"
+
+            print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+"""Gerador de carga para a API em execução.
+
+Uso:
+    python -m benchmarks.load_test [--url http://localhost:5000]
+        [--duration 60] [--concurrency 16] [--etag]
+
+Cria algumas listas de filmes, dispara requisições a todas as rotas da API
+com uma mistura próxima do uso real e, ao final, mostra a vazão e os
+percentis de latência de cada operação. As listas criadas são removidas
+ao fim do teste.
+
+Para não depender do OMDb e do serviço do top 100, execute a API apontando
+para o substituto local (python -m benchmarks.fake_upstream).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import random
+import time
+import uuid
+
+import requests
+
+# buscas usadas pela operação de busca de filmes
+SEARCH_TERMS = ["filme", "star", "love", "war", "man", "night", "house"]
+
+# peso padrão de cada operação na mistura
+DEFAULT_MIX = {
+    "list_watchlists": 20,
+    "get_watchlist": 25,
+    "search_movies": 15,
+    "get_movie": 10,
+    "top100": 8,
+    "movie_watchlists": 7,
+    "add_movie": 5,
+    "remove_movie": 4,
+    "put_watchlist": 3,
+    "create_delete_watchlist": 2,
+    "bulk_add": 1,
+}
+
+
+def random_imdb_id():
+    """Sorteia o id de um filme conhecido pelo substituto do OMDb."""
+    return f"tt{random.randrange(2000):07d}"
+
+
+class Client:
+    """Cliente de um usuário simulado, com a sua conexão e os seus ETags."""
+
+    def __init__(self, url: str, watchlists: dict, use_etag: bool):
+        """Cria o cliente.
+
+        Arguments:
+            url: endereço da API.
+            watchlists: listas criadas para o teste, por id, com o nome.
+            use_etag: envia o If-None-Match nas consultas às listas.
+        """
+        self.url = url.rstrip("/")
+        self.watchlists = watchlists
+        self.use_etag = use_etag
+        self.session = requests.Session()
+        self.etags = {}
+
+    def get(self, path: str, **kwargs):
+        """Faz um GET, revalidando a resposta anterior se houver ETag."""
+        headers = {}
+
+        if self.use_etag and path in self.etags:
+            headers["If-None-Match"] = self.etags[path]
+
+        response = self.session.get(
+            self.url + path, headers=headers, **kwargs
+        )
+
+        if "ETag" in response.headers:
+            self.etags[path] = response.headers["ETag"]
+
+        return response
+
+    def watchlist_id(self):
+        """Sorteia uma das listas do teste."""
+        return random.choice(list(self.watchlists))
+
+    def list_watchlists(self):
+        """Consulta a primeira página das listas."""
+        return self.get("/watchlist")
+
+    def get_watchlist(self):
+        """Consulta uma lista e os detalhes dos seus filmes."""
+        return self.get(f"/watchlist/{self.watchlist_id()}")
+
+    def search_movies(self):
+        """Busca filmes por texto."""
+        return self.session.get(
+            f"{self.url}/movies",
+            params={
+                "s": random.choice(SEARCH_TERMS),
+                "page": random.choice([1, 1, 1, 2]),
+            },
+        )
+
+    def get_movie(self):
+        """Consulta os detalhes de um filme."""
+        return self.session.get(f"{self.url}/movies/{random_imdb_id()}")
+
+    def top100(self):
+        """Consulta o top 100."""
+        return self.session.get(f"{self.url}/top100")
+
+    def movie_watchlists(self):
+        """Consulta as listas de uma página de resultados de busca."""
+        return self.session.get(
+            f"{self.url}/watchlist/movie",
+            params=[("imdb_ids", random_imdb_id()) for _ in range(10)],
+        )
+
+    def add_movie(self):
+        """Adiciona um filme a uma lista."""
+        return self.session.post(
+            f"{self.url}/watchlist/movie",
+            data={
+                "imdb_id": random_imdb_id(),
+                "watchlist_ids": [self.watchlist_id()],
+            },
+        )
+
+    def remove_movie(self):
+        """Remove um filme de uma lista (404 se ele não estiver nela)."""
+        return self.session.delete(
+            f"{self.url}/watchlist/{self.watchlist_id()}"
+            f"/movie/{random_imdb_id()}"
+        )
+
+    def put_watchlist(self):
+        """Edita a descrição de uma lista."""
+        id = self.watchlist_id()
+        return self.session.put(
+            f"{self.url}/watchlist",
+            data={
+                "id": id,
+                "name": self.watchlists[id],
+                "description": f"Editada em {time.time()}",
+            },
+        )
+
+    def create_delete_watchlist(self):
+        """Cria e remove uma lista."""
+        response = self.session.post(
+            f"{self.url}/watchlist",
+            data={"name": f"carga-{uuid.uuid4()}", "description": "-"},
+        )
+
+        if response.ok:
+            self.session.delete(
+                f"{self.url}/watchlist/{response.json()['id']}"
+            )
+
+        return response
+
+    def bulk_add(self):
+        """Adiciona vários filmes a várias listas."""
+        return self.session.post(
+            f"{self.url}/watchlist/movies/bulk",
+            json={
+                "imdb_ids": [random_imdb_id() for _ in range(10)],
+                "watchlist_ids": random.sample(
+                    list(self.watchlists), min(3, len(self.watchlists))
+                ),
+            },
+        )
+
+
+def setup(url: str, count: int, movies: int):
+    """Cria as listas do teste e retorna os seus ids e nomes."""
+    run = uuid.uuid4().hex[:8]
+    watchlists = {}
+
+    for i in range(count):
+        name = f"carga-{run}-{i}"
+        response = requests.post(
+            f"{url}/watchlist", data={"name": name, "description": "-"}
+        )
+        response.raise_for_status()
+        watchlists[response.json()["id"]] = name
+
+    requests.post(
+        f"{url}/watchlist/movies/bulk",
+        json={
+            "imdb_ids": [random_imdb_id() for _ in range(movies)],
+            "watchlist_ids": list(watchlists),
+        },
+    ).raise_for_status()
+
+    return watchlists
+
+
+def teardown(url: str, watchlists: dict):
+    """Remove as listas criadas para o teste."""
+    for id in watchlists:
+        requests.delete(f"{url}/watchlist/{id}")
+
+
+def worker(client: Client, mix: dict, deadline: float, think_time: float):
+    """Executa operações sorteadas até o fim do teste.
+
+    Retorna as amostras (operação, status, latência em segundos).
+    """
+    names = list(mix)
+    weights = list(mix.values())
+    samples = []
+
+    while time.monotonic() < deadline:
+        name = random.choices(names, weights)[0]
+        started = time.monotonic()
+
+        try:
+            status = getattr(client, name)().status_code
+        except requests.RequestException:
+            status = None
+
+        samples.append((name, status, time.monotonic() - started))
+
+        if think_time:
+            time.sleep(think_time)
+
+    return samples
+
+
+def percentile(values: list, p: float):
+    """Retorna o percentil p de uma lista ordenada (nearest-rank)."""
+    index = max(0, min(len(values) - 1, int(round(p * len(values))) - 1))
+    return values[index]
+
+
+def summarize(samples: list, duration: float):
+    """Agrupa as amostras por operação, calculando vazão e percentis."""
+    groups = {}
+
+    for name, status, elapsed in samples:
+        groups.setdefault(name, []).append((status, elapsed))
+
+    groups["total"] = [(status, elapsed) for _, status, elapsed in samples]
+
+    summary = {}
+
+    for name, items in groups.items():
+        latencies = sorted(elapsed * 1000 for _, elapsed in items)
+        statuses = [status for status, _ in items]
+
+        summary[name] = {
+            "requests": len(items),
+            "rps": len(items) / duration,
+            # 404 é esperado na remoção de filmes sorteados
+            "errors": sum(
+                status is None or status >= 500 or status == 429
+                for status in statuses
+            ),
+            "not_modified": statuses.count(304),
+            "p50": percentile(latencies, 0.50),
+            "p90": percentile(latencies, 0.90),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1],
+        }
+
+    return summary
+
+
+def print_summary(summary: dict):
+    """Mostra o resumo em forma de tabela."""
+    print(
+        f"{'operação':<26}{'reqs':>8}{'req/s':>9}{'erros':>7}{'304':>6}"
+        f"{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+    )
+
+    for name, s in summary.items():
+        print(
+            f"{name:<26}{s['requests']:>8}{s['rps']:>9.1f}{s['errors']:>7}"
+            f"{s['not_modified']:>6}{s['p50']:>9.1f}{s['p90']:>9.1f}"
+            f"{s['p95']:>9.1f}{s['p99']:>9.1f}{s['max']:>9.1f}"
+        )
+
+    print("\nlatências em milissegundos")
+
+
+def parse_mix(value: str):
+    """Converte "operação=peso,..." em um dicionário de pesos."""
+    mix = {}
+
+    for item in value.split(","):
+        name, weight = item.split("=")
+
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"operação inválida: {name}")
+
+        mix[name] = float(weight)
+
+    return mix
+
+
+def main():
+    """Executa o teste de carga."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument(
+        "--duration", type=float, default=60, help="duração, em segundos"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=16, help="usuários simultâneos"
+    )
+    parser.add_argument(
+        "--think-time",
+        type=float,
+        default=0,
+        help="pausa de cada usuário entre as requisições, em milissegundos",
+    )
+    parser.add_argument(
+        "--watchlists", type=int, default=20, help="listas criadas"
+    )
+    parser.add_argument(
+        "--movies", type=int, default=20, help="filmes em cada lista"
+    )
+    parser.add_argument(
+        "--etag",
+        action="store_true",
+        help="revalida as listas já consultadas com If-None-Match",
+    )
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help="pesos das operações, por exemplo get_watchlist=5,top100=1",
+    )
+    parser.add_argument(
+        "--output", help="salva o resumo em JSON no arquivo informado"
+    )
+    args = parser.parse_args()
+
+    url = args.url.rstrip("/")
+    watchlists = setup(url, args.watchlists, args.movies)
+
+    try:
+        deadline = time.monotonic() + args.duration
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(args.concurrency) as executor:
+            futures = [
+                executor.submit(
+                    worker,
+                    Client(url, watchlists, args.etag),
+                    args.mix,
+                    deadline,
+                    args.think_time / 1000,
+                )
+                for _ in range(args.concurrency)
+            ]
+            samples = [s for future in futures for s in future.result()]
+
+        duration = time.monotonic() - started
+
+    finally:
+        teardown(url, watchlists)
+
+    summary = summarize(samples, duration)
+    print_summary(summary)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
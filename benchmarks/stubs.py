@@ -0,0 +1,59 @@
+"""Substitutos locais do OMDb e do serviço do top 100.
+
+Trocam os métodos get dos clientes HTTP da API por respostas geradas na
+memória, para que os benchmarks não dependam da rede.
+"""
+from benchmarks.json_providers import omdb_movie
+from services.http_client import AsyncHttpClient, HttpClient
+
+
+class FakeResponse:
+    """Resposta HTTP com o corpo já decodificado."""
+
+    status_code = 200
+
+    def __init__(self, data):
+        """Cria a resposta com o JSON informado."""
+        self._data = data
+
+    def json(self):
+        """Retorna o corpo da resposta."""
+        return self._data
+
+    def raise_for_status(self):
+        """As respostas dos substitutos são sempre de sucesso."""
+
+
+def fake_response(url: str, params: dict = None):
+    """Gera a resposta do OMDb ou do top 100 para a requisição."""
+    params = params or {}
+
+    if "i" in params:
+        # o número do filme é o próprio id do imdb, como em omdb_movie
+        number = "".join(filter(str.isdigit, params["i"]))
+        return FakeResponse(omdb_movie(int(number or 0)))
+
+    movies = [
+        {
+            key: movie[key]
+            for key in ("Title", "Year", "imdbID", "Type", "Poster")
+        }
+        for movie in map(omdb_movie, range(10))
+    ]
+
+    return FakeResponse(
+        {"Search": movies, "totalResults": "10", "Response": "True"}
+    )
+
+
+def install():
+    """Substitui as requisições dos clientes HTTP pelos substitutos."""
+
+    def get(self, url, **kwargs):
+        return fake_response(url, kwargs.get("params"))
+
+    async def get_async(self, url, **kwargs):
+        return fake_response(url, kwargs.get("params"))
+
+    HttpClient.get = get
+    AsyncHttpClient.get = get_async
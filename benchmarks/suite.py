@@ -0,0 +1,369 @@
+"""Benchmarks da renderização, das consultas e das rotas da API.
+
+Uso:
+    python -m benchmarks.suite [--sizes 10,1000,100000] [--filter GET]
+    python -m benchmarks.suite --save-baseline
+
+Para cada tamanho, um processo separado cria uma base SQLite com a
+quantidade informada de filmes adicionados às listas, troca o OMDb e o top
+100 pelos substitutos de benchmarks.stubs e mede as operações por segundo e
+o pico de memória alocada por operação.
+
+Os resultados são comparados com a baseline salva (benchmarks/baseline.json
+por padrão) e o comando termina com erro se alguma operação ficar mais
+lenta ou alocar mais memória que o limite informado em --threshold.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+# quantidade de filmes em cada lista da base gerada
+WATCHLIST_SIZE = 20
+
+# quantidade máxima de filmes distintos na tabela movie
+MAX_MOVIES = 5000
+
+
+def seed(rows: int):
+    """Preenche a base com `rows` filmes adicionados às listas."""
+    from datetime import datetime
+
+    from models import AddedMovie, Movie, Session, Watchlist, engine
+    from benchmarks.json_providers import omdb_movie
+
+    # ao menos duas listas, já que a última recebe as escritas
+    movies = min(rows, MAX_MOVIES)
+    size = max(1, min(rows // 2, WATCHLIST_SIZE))
+    now = datetime.now()
+
+    session = Session()
+    Movie.upsert(session, [omdb_movie(i) for i in range(movies)])
+    session.commit()
+    Session.remove()
+
+    watchlists = [
+        {
+            "id": id,
+            "name": f"Lista {id:06d}",
+            "description": "Lista gerada para o benchmark",
+            "created_at": now,
+        }
+        for id in range(1, rows // size + 1)
+    ]
+
+    added_movies = [
+        {
+            "imdb_id": f"tt{(w['id'] * 7 + k) % movies:07d}",
+            "watchlist_id": w["id"],
+            "created_at": now,
+        }
+        for w in watchlists
+        for k in range(size)
+    ]
+
+    with engine.begin() as conn:
+        conn.execute(Watchlist.__table__.insert(), watchlists)
+        conn.execute(AddedMovie.__table__.insert(), added_movies)
+
+
+def benchmarks(client):
+    """Retorna as operações medidas, por nome."""
+    from sqlalchemy.orm import selectinload
+
+    from models import AddedMovie, Session, Watchlist
+    from routes.watchlist import add_movies
+    from schemas import render_watchlist, render_watchlists
+
+    session = Session()
+    watchlist = session.get(Watchlist, 1)
+    watchlist.to_dict()
+
+    # as operações de escrita usam a última lista, mantendo o ETag da
+    # primeira válido para a medida do 304
+    last_id = session.query(Watchlist.id).order_by(Watchlist.id.desc())[0][0]
+
+    page = (
+        session.query(Watchlist)
+        .options(selectinload(Watchlist.movies))
+        .order_by(Watchlist.id)
+        .limit(50)
+        .all()
+    )
+
+    imdb_id = watchlist.movies[0].imdb_id
+    imdb_ids = [m.imdb_id for m in watchlist.movies]
+    etag = client.get("/watchlist/1").headers["ETag"]
+
+    def listing_page():
+        # mesma consulta da página de GET /watchlist filtrada por filme
+        return (
+            session.query(
+                Watchlist.id, Watchlist.created_at, Watchlist.version
+            )
+            .filter(Watchlist.movies.any(AddedMovie.imdb_id == imdb_id))
+            .order_by(Watchlist.id)
+            .limit(51)
+            .all()
+        )
+
+    def movie_watchlists():
+        # mesma consulta de GET /watchlist/movie/<imdb_id>
+        return (
+            session.query(AddedMovie.watchlist_id)
+            .filter(AddedMovie.imdb_id == imdb_id)
+            .order_by(AddedMovie.watchlist_id)
+            .all()
+        )
+
+    def add_and_remove_movies():
+        # adiciona filmes novos à lista e os remove em seguida
+        add_movies(session, ["tt9999998", "tt9999999"], [last_id])
+        session.query(AddedMovie).filter(
+            AddedMovie.imdb_id.in_(["tt9999998", "tt9999999"])
+        ).delete(synchronize_session=False)
+        session.commit()
+
+    return {
+        "Watchlist.to_dict": watchlist.to_dict,
+        "render_watchlists (50 listas)": lambda: render_watchlists(page),
+        "render_watchlist": lambda: render_watchlist(watchlist),
+        "query: página de listas": listing_page,
+        "query: listas de um filme": movie_watchlists,
+        "query: add_movies": add_and_remove_movies,
+        "GET /watchlist": lambda: client.get("/watchlist"),
+        "GET /watchlist?imdb_id": lambda: client.get(
+            f"/watchlist?imdb_id={imdb_id}"
+        ),
+        "GET /watchlist/<id>": lambda: client.get("/watchlist/1"),
+        "GET /watchlist/<id>?fields": lambda: client.get(
+            "/watchlist/1?fields=Title,Year,Poster"
+        ),
+        "GET /watchlist/<id>?limit": lambda: client.get(
+            "/watchlist/1?limit=50"
+        ),
+        "GET /watchlist/<id> (304)": lambda: client.get(
+            "/watchlist/1", headers={"If-None-Match": etag}
+        ),
+        "GET /watchlist/movie/<imdb_id>": lambda: client.get(
+            f"/watchlist/movie/{imdb_id}"
+        ),
+        "GET /watchlist/movie?imdb_ids": lambda: client.get(
+            "/watchlist/movie",
+            query_string=[("imdb_ids", id) for id in imdb_ids],
+        ),
+        "GET /movies (busca local)": lambda: client.get(
+            "/movies?s=Filme"
+        ),
+        "GET /movies/<imdb_id>": lambda: client.get(f"/movies/{imdb_id}"),
+        "GET /top100": lambda: client.get("/top100"),
+        "PUT /watchlist": lambda: client.put(
+            "/watchlist",
+            data={
+                "id": last_id,
+                "name": f"Lista {last_id:06d}",
+                "description": "Editada",
+            },
+        ),
+    }
+
+
+def measure(fn, repeat: int, min_time: float):
+    """Mede as operações por segundo e o pico de memória de uma operação.
+
+    A quantidade de execuções por rodada é calibrada para durar ao menos
+    min_time segundos e é considerada a rodada mais rápida.
+    """
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / elapsed))
+
+    best = min(timer.repeat(repeat=repeat, number=number))
+
+    tracemalloc.start()
+    try:
+        fn()
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"ops": number / best, "peak_kib": (peak - current) / 1024}
+
+
+def run_worker(args):
+    """Executa os benchmarks de um tamanho de base, no diretório atual."""
+    import logging
+
+    from benchmarks import stubs
+
+    stubs.install()
+
+    import app
+
+    # os logs das requisições distorceriam as medidas
+    logging.disable(logging.CRITICAL)
+
+    seed(args.rows)
+    client = app.app.test_client()
+
+    results = {}
+
+    for name, fn in benchmarks(client).items():
+        if args.filter and args.filter not in name:
+            continue
+
+        results[name] = measure(fn, args.repeat, args.min_time)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f)
+
+
+def run_size(rows: int, args):
+    """Executa os benchmarks em um processo com uma base nova."""
+    with tempfile.TemporaryDirectory() as workdir:
+        output = os.path.join(workdir, "results.json")
+        env = {
+            **os.environ,
+            "PYTHONPATH": ROOT,
+            "API_KEY": "benchmark",
+            "MOVIE_REFRESH_INTERVAL": "0",
+            "MOVIE_CACHE_PATH": os.path.join(workdir, "cache.sqlite3"),
+            "TOP100_URL": "http://top100.benchmark/movies",
+        }
+
+        subprocess.run(
+            [
+                sys.executable, "-m", "benchmarks.suite",
+                "--worker", str(rows),
+                "--output", output,
+                "--repeat", str(args.repeat),
+                "--min-time", str(args.min_time),
+                "--filter", args.filter or "",
+            ],
+            cwd=workdir,
+            env=env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+
+        with open(output) as f:
+            return json.load(f)
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """Mostra os resultados e retorna as operações que pioraram."""
+    regressions = []
+
+    header = (
+        f"{'operação':<34}{'ops/s':>12}{'KiB/op':>10}"
+        f"{'base ops/s':>12}{'variação':>10}"
+    )
+
+    for size, benchmarks in results.items():
+        print(f"\n== {size} linhas ==")
+        print(header)
+
+        for name, result in benchmarks.items():
+            line = (
+                f"{name:<34}{result['ops']:>12.1f}"
+                f"{result['peak_kib']:>10.1f}"
+            )
+            base = baseline.get(size, {}).get(name)
+
+            if base:
+                change = result["ops"] / base["ops"] - 1
+                line += f"{base['ops']:>12.1f}{change:>+10.1%}"
+
+                slower = change < -threshold
+                bigger = result["peak_kib"] > base["peak_kib"] * (
+                    1 + threshold
+                ) and result["peak_kib"] - base["peak_kib"] > 1
+
+                if slower or bigger:
+                    regressions.append(f"{size}: {name}")
+                    line += "  <- piorou"
+
+            print(line)
+
+    return regressions
+
+
+def main():
+    """Executa os benchmarks e compara com a baseline."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--sizes",
+        default="10,1000,100000",
+        help="quantidades de filmes nas listas das bases geradas",
+    )
+    parser.add_argument(
+        "--filter", help="executa apenas as operações com este texto"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.2,
+        help="duração mínima de cada rodada, em segundos",
+    )
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="salva os resultados como a nova baseline",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="piora relativa tolerada antes de acusar uma regressão",
+    )
+    parser.add_argument(
+        "--worker", type=int, dest="rows", help=argparse.SUPPRESS
+    )
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.rows is not None:
+        return run_worker(args)
+
+    results = {
+        size: run_size(int(size), args) for size in args.sizes.split(",")
+    }
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+        print(f"\nBaseline salva em {args.baseline}")
+
+    elif regressions:
+        print("\nRegressões encontradas:")
+        print("\n".join(f"  {r}" for r in regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
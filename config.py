@@ -0,0 +1,46 @@
+from dotenv import dotenv_values
+import os
+
+# valores carregados na primeira leitura de uma configuração
+_values = None
+
+
+def load(path: str = ".env"):
+    """Carrega as configurações do arquivo .env informado.
+
+    Os valores do .env podem ser sobrescritos por variáveis de ambiente.
+    Não é preciso chamá-la: as configurações são carregadas do .env do
+    diretório atual na primeira leitura.
+    """
+    global _values
+    _values = {**dotenv_values(path), **os.environ}
+
+
+def get_str(name: str, default: str = None):
+    """Retorna o valor de uma configuração como texto."""
+    if _values is None:
+        load()
+
+    value = _values.get(name)
+    return value if value not in (None, "") else default
+
+
+def get_int(name: str, default: int):
+    """Retorna o valor de uma configuração como inteiro."""
+    value = get_str(name)
+    return int(value) if value is not None else default
+
+
+def get_float(name: str, default: float):
+    """Retorna o valor de uma configuração como float."""
+    value = get_str(name)
+    return float(value) if value is not None else default
+
+
+def get_bool(name: str, default: bool):
+    """Retorna o valor de uma configuração como booleano."""
+    value = get_str(name)
+    if value is None:
+        return default
+
+    return value.lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,101 @@
+from flask import json
+
+from logger import logger
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - o orjson é opcional
+    orjson = None
+
+
+class DefaultJSONProvider:
+    """Serializa as respostas com o JSON padrão do Flask."""
+
+    name = "default"
+
+    def __init__(self, app):
+        """Cria o serializador para a aplicação informada."""
+        self.app = app
+
+    def dumps(self, obj) -> bytes:
+        """Serializa o objeto, respeitando as configurações JSON do app."""
+        indent = None
+        separators = (",", ":")
+
+        if self.app.config["JSONIFY_PRETTYPRINT_REGULAR"] or self.app.debug:
+            indent = 2
+            separators = (", ", ": ")
+
+        data = json.dumps(
+            obj, app=self.app, indent=indent, separators=separators
+        )
+        return f"{data}\n".encode()
+
+    def response(self, obj):
+        """Cria a resposta JSON do objeto."""
+        return self.app.response_class(
+            self.dumps(obj), mimetype=self.app.config["JSONIFY_MIMETYPE"]
+        )
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Serializa as respostas com o orjson.
+
+    O resultado é equivalente ao do JSON padrão: as chaves são ordenadas
+    conforme o JSON_SORT_KEYS e as datas, os Decimals e os demais tipos que
+    o orjson não trata da mesma forma passam pelo encoder do Flask. Apenas
+    os caracteres não ASCII são enviados em UTF-8, em vez de escapados.
+
+    Se o orjson não conseguir serializar o objeto, a resposta é gerada pelo
+    JSON padrão.
+    """
+
+    name = "orjson"
+
+    def dumps(self, obj) -> bytes:
+        """Serializa o objeto, voltando ao JSON padrão em caso de erro."""
+        option = (
+            orjson.OPT_APPEND_NEWLINE
+            | orjson.OPT_NON_STR_KEYS
+            | orjson.OPT_PASSTHROUGH_DATETIME
+            | orjson.OPT_PASSTHROUGH_DATACLASS
+        )
+
+        if self.app.config["JSON_SORT_KEYS"]:
+            option |= orjson.OPT_SORT_KEYS
+
+        if self.app.config["JSONIFY_PRETTYPRINT_REGULAR"] or self.app.debug:
+            option |= orjson.OPT_INDENT_2
+
+        try:
+            return orjson.dumps(
+                obj, default=self.app.json_encoder().default, option=option
+            )
+
+        except TypeError as e:
+            logger.debug("Resposta serializada pelo JSON padrão: %s", e)
+            return super().dumps(obj)
+
+
+# serializadores disponíveis, escolhidos pela configuração JSON_PROVIDER
+json_providers = {
+    DefaultJSONProvider.name: DefaultJSONProvider,
+    OrjsonProvider.name: OrjsonProvider,
+}
+
+
+def create_json_provider(app, name: str = "orjson"):
+    """Cria o serializador de respostas informado.
+
+    Se o orjson não estiver instalado é usado o JSON padrão do Flask.
+    """
+    if name not in json_providers:
+        raise ValueError(
+            f"JSON_PROVIDER deve ser um de {', '.join(json_providers)}"
+        )
+
+    if name == OrjsonProvider.name and orjson is None:
+        logger.warning("orjson não instalado, usando o JSON padrão")
+        name = DefaultJSONProvider.name
+
+    return json_providers[name](app)
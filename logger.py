@@ -1,13 +1,107 @@
 from logging.config import dictConfig
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+)
+from queue import SimpleQueue
+import atexit
+import copy
 import logging
 import os
 
+import config
+
 
 log_path = "log/"
-# Verifica se o diretorio para armexanar os logs não existe
-if not os.path.exists(log_path):
-   # então cria o diretorio
-   os.makedirs(log_path)
+
+
+def prepare_log_files(handlers):
+    """Cria a pasta dos logs e aplica a rotação configurada aos arquivos.
+
+    É chamada no primeiro registro de cada processo, e não na importação,
+    de modo que importar a aplicação não lê o .env nem cria a pasta. O
+    tamanho máximo de cada arquivo e a quantidade de arquivos mantidos vêm
+    de LOG_MAX_BYTES e LOG_BACKUP_COUNT.
+    """
+    # Verifica se o diretorio para armexanar os logs não existe
+    if not os.path.exists(log_path):
+        # então cria o diretorio
+        os.makedirs(log_path, exist_ok=True)
+
+    for handler in handlers:
+        if isinstance(handler, RotatingFileHandler):
+            handler.maxBytes = config.get_int(
+                "LOG_MAX_BYTES", 10 * 1024 * 1024
+            )
+            handler.backupCount = config.get_int("LOG_BACKUP_COUNT", 10)
+
+
+class QueueListenerHandler(QueueHandler):
+    """Envia os registros de log para uma fila atendida em segundo plano.
+
+    A thread que registra o log apenas coloca o registro na fila; a
+    formatação, a escrita nos arquivos e a rotação deles são feitas pelos
+    handlers informados, na thread do QueueListener.
+
+    A thread só é iniciada no primeiro registro de cada processo, de modo
+    que os workers criados por fork, após o preload da aplicação, têm a sua
+    própria fila e thread.
+    """
+
+    def __init__(self, handlers):
+        """Cria o handler, sem iniciar a thread que consome a fila.
+
+        Arguments:
+            handlers: handlers que efetivamente escrevem os registros.
+        """
+        super().__init__(SimpleQueue())
+
+        # a lista vinda do dictConfig só resolve os handlers ao ser indexada
+        self.targets = [handlers[i] for i in range(len(handlers))]
+        self.listener = None
+        self._pid = None
+
+        atexit.register(self.stop)
+
+    def start(self):
+        """Inicia a thread que consome a fila no processo atual."""
+        prepare_log_files(self.targets)
+
+        # após um fork, a fila e a thread do processo pai não servem
+        self.queue = SimpleQueue()
+        self.listener = QueueListener(
+            self.queue, *self.targets, respect_handler_level=True
+        )
+        self.listener.start()
+        self._pid = os.getpid()
+
+    def stop(self):
+        """Escreve os registros pendentes e encerra a thread."""
+        if self._pid == os.getpid():
+            self.listener.stop()
+            self._pid = None
+
+    def enqueue(self, record):
+        """Coloca o registro na fila, iniciando a thread se necessário.
+
+        O emit, que chama este método, já é protegido pelo lock do handler.
+        """
+        if self._pid != os.getpid():
+            self.start()
+
+        self.queue.put_nowait(record)
+
+    def prepare(self, record):
+        """Prepara o registro para a fila, sem formatá-lo.
+
+        Os registros não saem do processo, então basta fixar a mensagem,
+        já que os argumentos podem mudar até o registro ser escrito.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
 
 
 dictConfig({
@@ -41,28 +135,40 @@ dictConfig({
             "class": "logging.handlers.RotatingFileHandler",
             "formatter": "detailed",
             "filename": "log/gunicorn.error.log",
-            "maxBytes": 10000,
-            "backupCount": 10,
             "delay": "True",
         },
         "detailed_file": {
             "class": "logging.handlers.RotatingFileHandler",
             "formatter": "detailed",
             "filename": "log/gunicorn.detailed.log",
-            "maxBytes": 10000,
-            "backupCount": 10,
             "delay": "True",
-        }
+        },
+        # filas que levam os registros aos handlers acima em segundo plano
+        "queue": {
+            "()": QueueListenerHandler,
+            "handlers": [
+                "cfg://handlers.console",
+                "cfg://handlers.detailed_file",
+            ],
+        },
+        "error_queue": {
+            "()": QueueListenerHandler,
+            "handlers": [
+                "cfg://handlers.console",
+                "cfg://handlers.error_file",
+                # "cfg://handlers.email",
+            ],
+        },
     },
     "loggers": {
         "gunicorn.error": {
-            "handlers": ["console", "error_file"],  #, email],
+            "handlers": ["error_queue"],
             "level": "INFO",
             "propagate": False,
         }
     },
     "root": {
-        "handlers": ["console", "detailed_file"],
+        "handlers": ["queue"],
         "level": "INFO",
     }
 })
@@ -0,0 +1,283 @@
+"""Métricas da API no formato de texto do Prometheus.
+
+Os contadores e histogramas ficam na memória do processo e são expostos
+pela rota /metrics. As métricas que já são acumuladas por outras partes
+da API (pool do banco, cache de filmes, clientes HTTP) são lidas no
+momento da coleta, por meio de funções registradas com `callback`.
+"""
+from bisect import bisect_left
+import threading
+
+# limites padrão dos histogramas de latência, em segundos
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def _format_labels(labels: dict):
+    """Formata os rótulos de uma amostra."""
+    if not labels:
+        return ""
+
+    items = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value)
+            .replace("\\", "\\\\")
+            .replace("\n", "\\n")
+            .replace('"', '\\"'),
+        )
+        for name, value in labels.items()
+    )
+    return "{" + items + "}"
+
+
+def _format_value(value: float):
+    """Formata o valor de uma amostra."""
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base das métricas, com rótulos e acesso protegido por um lock."""
+
+    type = None
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        """Cria a métrica.
+
+        Arguments:
+            name: nome da métrica.
+            help: descrição mostrada no /metrics.
+            labels: nomes dos rótulos que cada amostra recebe.
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict):
+        """Retorna a chave dos valores para os rótulos informados."""
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self):
+        """Retorna as amostras (sufixo, rótulos, valor) da métrica."""
+        raise NotImplementedError
+
+    def collect(self):
+        """Retorna as linhas da métrica no formato do Prometheus."""
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+
+        for suffix, labels, value in self.samples():
+            lines.append(
+                f"{self.name}{suffix}{_format_labels(labels)} "
+                f"{_format_value(value)}"
+            )
+
+        return lines
+
+
+class Counter(Metric):
+    """Contador que só aumenta."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        """Incrementa o contador dos rótulos informados."""
+        key = self._key(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        """Retorna o valor de cada combinação de rótulos."""
+        with self._lock:
+            values = list(self._values.items())
+
+        return [
+            ("", dict(zip(self.labels, key)), value) for key, value in values
+        ]
+
+
+class Histogram(Metric):
+    """Histograma com limites fixos, como o do Prometheus."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS,
+    ):
+        """Cria o histograma.
+
+        Arguments:
+            buckets: limites superiores das faixas, em ordem crescente.
+        """
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        """Registra uma observação nos rótulos informados."""
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+
+        with self._lock:
+            counts, total = self._values.get(
+                key, ([0] * (len(self.buckets) + 1), 0.0)
+            )
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        """Retorna as faixas acumuladas, a soma e a contagem."""
+        with self._lock:
+            values = [
+                (key, list(counts), total)
+                for key, (counts, total) in self._values.items()
+            ]
+
+        samples = []
+
+        for key, counts, total in values:
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket = {**labels, "le": _format_value(bound)}
+                samples.append(("_bucket", bucket, cumulative))
+
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, cumulative))
+
+        return samples
+
+
+class Callback(Metric):
+    """Métrica lida de uma função no momento da coleta.
+
+    A função retorna o valor da métrica ou uma lista de pares
+    (rótulos, valor).
+    """
+
+    def __init__(self, name: str, help: str, type: str, fn):
+        """Cria a métrica.
+
+        Arguments:
+            type: tipo da métrica no Prometheus (counter ou gauge).
+            fn: função que retorna os valores atuais.
+        """
+        super().__init__(name, help)
+        self.type = type
+        self.fn = fn
+
+    def samples(self):
+        """Retorna os valores atuais."""
+        result = self.fn()
+
+        if isinstance(result, (int, float)):
+            return [("", {}, result)]
+
+        return [("", labels, value) for labels, value in result]
+
+
+class Registry:
+    """Conjunto das métricas expostas pela API."""
+
+    def __init__(self):
+        """Cria o registro vazio."""
+        self._metrics = {}
+
+    def register(self, metric: Metric):
+        """Adiciona a métrica ao registro e a retorna."""
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica {metric.name} já registrada")
+
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple = ()):
+        """Cria e registra um contador."""
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), **kwargs):
+        """Cria e registra um histograma."""
+        return self.register(Histogram(name, help, labels, **kwargs))
+
+    def callback(self, name: str, help: str, type: str = "gauge"):
+        """Registra a função decorada como uma métrica lida na coleta."""
+
+        def decorator(fn):
+            self.register(Callback(name, help, type, fn))
+            return fn
+
+        return decorator
+
+    def collect(self):
+        """Retorna todas as métricas no formato de texto do Prometheus."""
+        lines = []
+
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+
+        return "\n".join(lines) + "\n"
+
+
+# registro único, compartilhado por toda a API
+registry = Registry()
+
+# requisições às rotas da API
+http_requests = registry.counter(
+    "http_requests_total",
+    "Requisições atendidas, por rota e status.",
+    ("method", "route", "status"),
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds",
+    "Duração das requisições, por rota.",
+    ("method", "route"),
+)
+
+# requisições às APIs externas
+upstream_requests = registry.counter(
+    "upstream_requests_total",
+    "Requisições às APIs externas, por serviço e status (ou erro).",
+    ("service", "status"),
+)
+upstream_request_duration = registry.histogram(
+    "upstream_request_duration_seconds",
+    "Duração das requisições às APIs externas, por serviço.",
+    ("service",),
+)
+
+# consultas ao banco
+db_queries = registry.counter(
+    "db_queries_total",
+    "Consultas executadas no banco, por rota.",
+    ("method", "route"),
+)
+db_queries_per_request = registry.histogram(
+    "db_queries_per_request",
+    "Quantidade de consultas ao banco por requisição, por rota.",
+    ("method", "route"),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+db_query_time = registry.counter(
+    "db_query_seconds_total",
+    "Tempo gasto nas consultas ao banco, por rota.",
+    ("method", "route"),
+)
+db_repeated_queries = registry.counter(
+    "db_repeated_queries_total",
+    "Requisições com uma mesma consulta repetida (possível N+1), por rota.",
+    ("method", "route"),
+)
@@ -1,40 +1,263 @@
 from sqlalchemy_utils import database_exists, create_database
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine, event
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy import create_engine, event, inspect
 from sqlalchemy.engine import Engine
+from flask.globals import _app_ctx_stack
+from contextlib import contextmanager
 import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - o fcntl não existe no Windows
+    fcntl = None
+
+import config
 
 # importando os elementos definidos no modelo
 from models.base import Base
 from models.added_movie import AddedMovie
 from models.watchlist import Watchlist
+from models.movie import Movie
+from models.instrumentation import (
+    InstrumentedQueuePool,
+    PoolStats,
+    QueryStats,
+)
+
+
+def _choice(name: str, default: str, options: tuple):
+    """Lê uma configuração que deve ser uma das opções informadas."""
+    value = config.get_str(name, default).upper()
+
+    if value not in options:
+        raise ValueError(f"{name} deve ser um de {', '.join(options)}")
+
+    return value
+
+
+# PRAGMAs de desempenho aplicados a cada nova conexão com o sqlite3,
+# lidos da configuração ao criar a engine.
+# O WAL permite leituras simultâneas a uma escrita e o busy_timeout faz
+# as escritas concorrentes aguardarem o lock em vez de falharem com
+# "database is locked".
+sqlite_pragmas = {}
+
+
+def load_sqlite_pragmas():
+    """Lê da configuração os PRAGMAs aplicados às conexões."""
+    return {
+        "journal_mode": _choice(
+            "DB_JOURNAL_MODE",
+            "WAL",
+            ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"),
+        ),
+        "synchronous": _choice(
+            "DB_SYNCHRONOUS", "NORMAL", ("OFF", "NORMAL", "FULL", "EXTRA")
+        ),
+        "busy_timeout": config.get_int("DB_BUSY_TIMEOUT", 5000),
+        "cache_size": config.get_int("DB_CACHE_SIZE", -65536),
+        "mmap_size": config.get_int("DB_MMAP_SIZE", 268435456),
+        "temp_store": _choice(
+            "DB_TEMP_STORE", "MEMORY", ("DEFAULT", "FILE", "MEMORY")
+        ),
+    }
 
 
 @event.listens_for(Engine, "connect")
 def set_sqlite_pragma(dbapi_connection, connection_record):
-    """Ativa o suporte a foreign keys no sqlite3."""
+    """Ativa o suporte a foreign keys e os PRAGMAs de desempenho."""
     cursor = dbapi_connection.cursor()
     cursor.execute("PRAGMA foreign_keys=ON")
+
+    for name, value in sqlite_pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+
     cursor.close()
 
 
 db_path = "database/"
-# Verifica se o diretorio não existe
-if not os.path.exists(db_path):
-    # então cria o diretorio
-    os.makedirs(db_path)
 # url de acesso ao banco (essa é uma url de acesso ao sqlite local)
 db_url = "sqlite:///%s/db.sqlite3" % db_path
 
-# cria a engine de conexão com o banco
-engine = create_engine(db_url, echo=False)
+# estatísticas de uso do pool de conexões
+pool_stats = PoolStats()
+InstrumentedQueuePool.stats = pool_stats
+
+# acompanha as consultas de cada requisição, detectando o padrão N+1
+query_stats = QueryStats()
+
+# engine criada na primeira utilização do banco, uma por processo
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def migrate(engine):
+    """Cria o banco, as tabelas, as colunas e os índices que faltarem."""
+    # cria o banco se ele não existir
+    if not database_exists(engine.url):
+        create_database(engine.url)
+
+    # cria as tabelas do banco, caso não existam
+    Base.metadata.create_all(engine)
+
+    # cria as colunas adicionadas depois que as tabelas já existiam; elas
+    # precisam de um server_default para preencher as linhas existentes
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {
+            column["name"] for column in inspector.get_columns(table.name)
+        }
+
+        for column in table.columns:
+            if column.name in existing:
+                continue
+
+            ddl = (
+                f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                f"{column.type.compile(engine.dialect)}"
+            )
+
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+
+                if not column.nullable:
+                    ddl += " NOT NULL"
+
+            with engine.begin() as conn:
+                conn.exec_driver_sql(ddl)
+
+    # cria os índices adicionados depois que as tabelas já existiam
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    # cria o índice de busca textual dos filmes
+    Movie.create_search_index(engine)
+
+
+@contextmanager
+def migration_lock():
+    """Impede que vários processos migrem o banco ao mesmo tempo.
+
+    Os workers de um servidor sem preload preparam o banco ao mesmo tempo
+    na primeira requisição; o lock em arquivo faz um deles migrar e os
+    demais aguardarem para apenas conferir o resultado.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    with open(os.path.join(db_path, ".migrate.lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+
+        try:
+            yield
+
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def init_db():
+    """Cria a engine e prepara o banco, na primeira utilização.
+
+    Nada é feito na importação dos modelos: a configuração é lida, o banco
+    é criado e migrado e as conexões são abertas apenas quando a primeira
+    sessão é usada. Retorna a engine do processo.
+    """
+    global _engine
+
+    if _engine is not None:
+        return _engine
+
+    with _engine_lock:
+        if _engine is not None:
+            return _engine
+
+        sqlite_pragmas.update(load_sqlite_pragmas())
+        pool_stats.slow_checkout = config.get_float("DB_SLOW_CHECKOUT", 1.0)
+        query_stats.repeated_threshold = config.get_int(
+            "DB_REPEATED_QUERY_THRESHOLD", 5
+        )
+
+        # Verifica se o diretorio não existe
+        if not os.path.exists(db_path):
+            # então cria o diretorio
+            os.makedirs(db_path)
+
+        # cria a engine de conexão com o banco, com um pool dimensionado
+        # para workers com várias threads
+        engine = create_engine(
+            db_url,
+            echo=False,
+            poolclass=InstrumentedQueuePool,
+            pool_size=config.get_int("DB_POOL_SIZE", 10),
+            max_overflow=config.get_int("DB_MAX_OVERFLOW", 10),
+            pool_timeout=config.get_float("DB_POOL_TIMEOUT", 30),
+            connect_args={
+                # as conexões do pool são compartilhadas entre threads
+                "check_same_thread": False,
+                "timeout": sqlite_pragmas["busy_timeout"] / 1000,
+            },
+        )
+
+        pool_stats.attach(engine)
+        query_stats.attach(engine)
+
+        with migration_lock():
+            migrate(engine)
+
+        _engine = engine
+
+    return _engine
+
+
+def _after_fork():
+    """Descarta no processo filho as conexões abertas pelo processo pai.
+
+    Com o preload de um servidor que cria os workers por fork, as conexões
+    do pool do pai não podem ser usadas pelos filhos; cada worker abre as
+    suas conexões quando precisar delas.
+    """
+    global _engine_lock
+
+    _engine_lock = threading.Lock()
+
+    if _engine is not None:
+        _engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def __getattr__(name: str):
+    """Cria a engine ao ser acessada como models.engine."""
+    if name == "engine":
+        return init_db()
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def session_scope():
+    """Identifica o escopo da sessão do banco.
+
+    Dentro de uma requisição o escopo é o contexto da aplicação do Flask,
+    que acompanha a requisição mesmo no código executado em outra thread
+    com o seu contexto. Fora dela, o escopo é a thread atual.
+    """
+    context = _app_ctx_stack.top
+    return context if context is not None else threading.get_ident()
+
+
+_session_factory = sessionmaker()
+
 
-# Instancia um criador de seção com o banco
-Session = sessionmaker(bind=engine)
+def create_session():
+    """Cria uma sessão com o banco, preparando-o se necessário."""
+    return _session_factory(bind=init_db())
 
-# cria o banco se ele não existir
-if not database_exists(engine.url):
-    create_database(engine.url)
 
-# cria as tabelas do banco, caso não existam
-Base.metadata.create_all(engine)
+# Instancia um criador de seção com o banco. A sessão é única por
+# requisição (ou thread) e deve ser removida ao fim de cada requisição,
+# devolvendo a conexão ao pool
+Session = scoped_session(create_session, scopefunc=session_scope)
@@ -22,10 +22,10 @@ class AddedMovie(Base):
 
     id = Column(Integer, primary_key=True)
     imdb_id = Column(String(12))
-    created_at = Column(DateTime, default=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
 
     watchlist_id = Column(
-        Integer, ForeignKey("watchlist.id", ondelete="CASCADE")
+        Integer, ForeignKey("watchlist.id", ondelete="CASCADE"), index=True
     )
     watchlist = relationship(
         "Watchlist",
@@ -33,7 +33,9 @@ class AddedMovie(Base):
         back_populates="movies",
     )
 
-    # Criando um requisito de unicidade envolvendo uma par de informações
+    # Criando um requisito de unicidade envolvendo uma par de informações.
+    # O índice criado por ele começa pelo imdb_id e também atende, como
+    # índice de cobertura, as buscas das listas de um filme.
     __table_args__ = (
         UniqueConstraint(
             "imdb_id", "watchlist_id", name="added_movie_unique_id"
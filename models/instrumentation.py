@@ -0,0 +1,233 @@
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from flask import g, has_app_context, has_request_context, request
+import re
+import threading
+import time
+
+from logger import logger
+
+
+class PoolStats:
+    """Acumula as estatísticas de uso do pool de conexões do banco.
+
+    Mede quanto tempo cada requisição esperou por uma conexão e quanto
+    tempo a manteve, registrando um aviso para as conexões retidas por
+    mais tempo que o limite configurado.
+    """
+
+    def __init__(self, slow_checkout: float = 1.0):
+        """Cria o acumulador.
+
+        Arguments:
+            slow_checkout: tempo, em segundos, a partir do qual uma conexão
+                retida é registrada no log.
+        """
+        self.slow_checkout = slow_checkout
+        self.pool = None
+
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.slow_checkouts = 0
+        self.max_hold_time = 0.0
+
+    def attach(self, engine):
+        """Passa a acompanhar os eventos do pool da engine."""
+        self.pool = engine.pool
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+
+    def record_wait(self, seconds: float):
+        """Registra o tempo de espera por uma conexão do pool."""
+        with self._lock:
+            self.waits += 1
+            self.wait_time += seconds
+            self.max_wait_time = max(self.max_wait_time, seconds)
+
+    def _on_checkout(self, dbapi_connection, connection_record, proxy):
+        """Marca o instante e a rota em que a conexão foi retirada."""
+        connection_record.info["checkout_at"] = time.monotonic()
+        connection_record.info["checkout_route"] = (
+            f"{request.method} {request.path}"
+            if has_request_context()
+            else None
+        )
+
+        with self._lock:
+            self.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        """Mede por quanto tempo a conexão ficou retida."""
+        checkout_at = connection_record.info.pop("checkout_at", None)
+        route = connection_record.info.pop("checkout_route", None)
+
+        if checkout_at is None:
+            return
+
+        held = time.monotonic() - checkout_at
+
+        with self._lock:
+            self.max_hold_time = max(self.max_hold_time, held)
+
+            if held > self.slow_checkout:
+                self.slow_checkouts += 1
+
+        if held > self.slow_checkout:
+            logger.warning(
+                "Conexão do banco retida por %.3fs em %s",
+                held,
+                route or "tarefa fora de requisição",
+            )
+
+    def stats(self):
+        """Retorna as estatísticas atuais do pool."""
+        stats = {
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "wait_time_total": self.wait_time,
+            "wait_time_max": self.max_wait_time,
+            "slow_checkouts": self.slow_checkouts,
+            "hold_time_max": self.max_hold_time,
+        }
+
+        if self.pool is not None:
+            stats.update(
+                {
+                    "size": self.pool.size(),
+                    "checked_out": self.pool.checkedout(),
+                    "overflow": max(self.pool.overflow(), 0),
+                }
+            )
+
+        return stats
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mede o tempo de espera por cada conexão."""
+
+    stats = None
+
+    def _do_get(self):
+        """Retira uma conexão do pool, medindo a espera."""
+        started = time.monotonic()
+
+        try:
+            return super()._do_get()
+
+        finally:
+            if self.stats is not None:
+                self.stats.record_wait(time.monotonic() - started)
+
+
+class QueryStats:
+    """Acompanha as consultas ao banco feitas em cada requisição.
+
+    Conta as consultas e o tempo gasto nelas e agrupa as consultas pelo
+    formato do SQL, sem os valores dos parâmetros. Um mesmo formato
+    repetido várias vezes na requisição indica o padrão N+1: uma consulta
+    por item de uma lista em vez de uma única consulta para todos.
+    """
+
+    def __init__(self, repeated_threshold: int = 5):
+        """Cria o acompanhamento.
+
+        Arguments:
+            repeated_threshold: quantidade de repetições de um mesmo
+                formato de consulta, na mesma requisição, a partir da qual
+                ela é registrada no log.
+        """
+        self.repeated_threshold = repeated_threshold
+
+        self._lock = threading.Lock()
+        self.flagged_requests = 0
+
+    def attach(self, engine):
+        """Passa a acompanhar as consultas da engine."""
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+
+    @staticmethod
+    def shape(statement: str):
+        """Retorna o formato da consulta.
+
+        Os espaços são normalizados e as listas de parâmetros do IN, que
+        variam com a quantidade de itens, são reduzidas a um só.
+        """
+        statement = " ".join(statement.split())
+        return re.sub(r"\(\?(?:, \?)*\)", "(?)", statement)
+
+    def _before_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        """Marca o início da consulta."""
+        if has_app_context():
+            conn.info.setdefault("query_started", []).append(
+                time.monotonic()
+            )
+
+    def _after_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        """Registra a consulta na requisição atual."""
+        started = conn.info.get("query_started")
+
+        if not has_app_context() or not started:
+            return
+
+        g.db_queries = g.get("db_queries", 0) + 1
+        g.db_time = g.get("db_time", 0.0) + time.monotonic() - started.pop()
+
+        statements = g.setdefault("db_statements", {})
+        shape = self.shape(statement)
+        statements[shape] = statements.get(shape, 0) + 1
+
+    def repeated(self):
+        """Retorna as consultas repetidas na requisição atual.
+
+        Cada item é um par (formato, repetições), do mais repetido para o
+        menos repetido.
+        """
+        statements = g.get("db_statements", {})
+
+        return sorted(
+            (
+                (shape, count)
+                for shape, count in statements.items()
+                if count >= self.repeated_threshold
+            ),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+
+    def report(self):
+        """Registra no log as consultas repetidas da requisição atual.
+
+        Retorna o resumo das consultas da requisição.
+        """
+        repeated = self.repeated()
+
+        if repeated:
+            with self._lock:
+                self.flagged_requests += 1
+
+            for shape, count in repeated:
+                logger.warning(
+                    "Possível N+1 em %s %s: consulta repetida %d vezes: %s",
+                    request.method,
+                    request.path,
+                    count,
+                    shape[:300],
+                )
+
+        return {
+            "queries": g.get("db_queries", 0),
+            "time": g.get("db_time", 0.0),
+            "repeated": repeated[0][1] if repeated else 0,
+        }
+
+    def stats(self):
+        """Retorna a quantidade de requisições com consultas repetidas."""
+        return {"flagged_requests": self.flagged_requests}
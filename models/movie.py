@@ -0,0 +1,342 @@
+from sqlalchemy import Column, String, Text, DateTime, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from datetime import datetime, timedelta
+from typing import List
+import json
+import re
+
+from logger import logger
+from models import Base, AddedMovie, Watchlist
+
+
+# Índice de busca textual (FTS5) sobre a tabela movie. O conteúdo fica na
+# própria tabela movie e os gatilhos mantêm o índice sincronizado.
+MOVIE_SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS movie_search USING fts5(
+        title, actors, director, genre,
+        content='movie',
+        content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movie_search_insert
+    AFTER INSERT ON movie BEGIN
+        INSERT INTO movie_search (rowid, title, actors, director, genre)
+        VALUES (new.rowid, new.title, new.actors, new.director, new.genre);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movie_search_delete
+    AFTER DELETE ON movie BEGIN
+        INSERT INTO movie_search
+            (movie_search, rowid, title, actors, director, genre)
+        VALUES ('delete', old.rowid, old.title, old.actors, old.director,
+                old.genre);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movie_search_update
+    AFTER UPDATE ON movie BEGIN
+        INSERT INTO movie_search
+            (movie_search, rowid, title, actors, director, genre)
+        VALUES ('delete', old.rowid, old.title, old.actors, old.director,
+                old.genre);
+        INSERT INTO movie_search (rowid, title, actors, director, genre)
+        VALUES (new.rowid, new.title, new.actors, new.director, new.genre);
+    END
+    """,
+]
+
+
+class Movie(Base):
+    """Classe que representa a tabela de detalhes dos filmes.
+
+    Guarda localmente os dados do OMDb dos filmes adicionados às listas ou
+    consultados, evitando chamadas à API na exibição das listas e
+    permitindo a busca local por texto.
+    """
+
+    # O name da tabela no banco de dados
+    __tablename__ = "movie"
+
+    imdb_id = Column(String(12), primary_key=True)
+    title = Column(String(500))
+    year = Column(String(20))
+    rated = Column(String(20))
+    released = Column(String(20))
+    runtime = Column(String(20))
+    genre = Column(String(200))
+    director = Column(String(500))
+    writer = Column(String(1000))
+    actors = Column(String(1000))
+    plot = Column(Text)
+    language = Column(String(200))
+    country = Column(String(200))
+    awards = Column(String(500))
+    poster = Column(String(500))
+    ratings = Column(Text)
+    metascore = Column(String(10))
+    imdb_rating = Column(String(10))
+    imdb_votes = Column(String(20))
+    type = Column(String(20))
+    dvd = Column(String(20))
+    box_office = Column(String(30))
+    production = Column(String(200))
+    website = Column(String(500))
+
+    # data da última atualização dos dados a partir do OMDb
+    updated_at = Column(DateTime, default=datetime.now, index=True)
+
+    # relação entre os campos do OMDb e as colunas da tabela
+    omdb_fields = {
+        "imdbID": "imdb_id",
+        "Title": "title",
+        "Year": "year",
+        "Rated": "rated",
+        "Released": "released",
+        "Runtime": "runtime",
+        "Genre": "genre",
+        "Director": "director",
+        "Writer": "writer",
+        "Actors": "actors",
+        "Plot": "plot",
+        "Language": "language",
+        "Country": "country",
+        "Awards": "awards",
+        "Poster": "poster",
+        "Ratings": "ratings",
+        "Metascore": "metascore",
+        "imdbRating": "imdb_rating",
+        "imdbVotes": "imdb_votes",
+        "Type": "type",
+        "DVD": "dvd",
+        "BoxOffice": "box_office",
+        "Production": "production",
+        "Website": "website",
+    }
+
+    # quantidade máxima de filmes por INSERT
+    upsert_batch_size = 500
+
+    def __init__(self, imdb_id: str, **columns):
+        """Cria um filme.
+
+        Arguments:
+            imdb_id: id do filme no imdb.
+            columns (optional): demais colunas do filme.
+        """
+        self.imdb_id = imdb_id
+
+        for name, value in columns.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def columns_from_omdb(cls, data: dict):
+        """Converte uma resposta de detalhes do OMDb nas colunas da tabela."""
+        columns = {
+            column: data.get(field)
+            for field, column in cls.omdb_fields.items()
+        }
+        columns["ratings"] = json.dumps(data.get("Ratings") or [])
+        columns["updated_at"] = datetime.now()
+
+        return columns
+
+    @classmethod
+    def upsert(cls, session, movies: List[dict]):
+        """Insere ou atualiza os filmes a partir das respostas do OMDb.
+
+        As listas que contêm os filmes mudam de versão, invalidando os ETags
+        já enviados aos clientes. As alterações só são efetivadas no commit
+        da sessão.
+        """
+        rows = [cls.columns_from_omdb(movie) for movie in movies]
+
+        # insere em lotes para respeitar o limite de parâmetros do sqlite
+        for i in range(0, len(rows), cls.upsert_batch_size):
+            batch = rows[i:i + cls.upsert_batch_size]
+
+            statement = sqlite_insert(cls.__table__).values(batch)
+            statement = statement.on_conflict_do_update(
+                index_elements=["imdb_id"],
+                set_={
+                    column: statement.excluded[column]
+                    for column in rows[0]
+                    if column != "imdb_id"
+                },
+            )
+
+            session.execute(statement)
+
+            watchlist_ids = session.query(AddedMovie.watchlist_id).filter(
+                AddedMovie.imdb_id.in_([row["imdb_id"] for row in batch])
+            )
+            Watchlist.touch(session, watchlist_ids.scalar_subquery())
+
+    @classmethod
+    def is_fresh(cls, session, imdb_id: str, max_age: int):
+        """Indica se o filme está guardado e foi atualizado há pouco.
+
+        Arguments:
+            imdb_id: id do filme no imdb.
+            max_age: idade máxima dos dados do filme, em segundos.
+        """
+        threshold = datetime.now() - timedelta(seconds=max_age)
+
+        row = (
+            session.query(cls.imdb_id)
+            .filter(cls.imdb_id == imdb_id, cls.updated_at >= threshold)
+            .first()
+        )
+        return row is not None
+
+    # indica se o sqlite possui o FTS5 e o índice de busca foi criado
+    search_enabled = False
+
+    @classmethod
+    def create_search_index(cls, engine):
+        """Cria o índice de busca textual, caso ainda não exista.
+
+        Se o sqlite não tiver suporte ao FTS5 a busca local fica desativada.
+        """
+        try:
+            with engine.begin() as conn:
+                exists = conn.exec_driver_sql(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'movie_search'"
+                ).first()
+
+                for statement in MOVIE_SEARCH_DDL:
+                    conn.exec_driver_sql(statement)
+
+                # indexa os filmes guardados antes da criação do índice
+                if not exists:
+                    conn.exec_driver_sql(
+                        "INSERT INTO movie_search (movie_search)"
+                        " VALUES ('rebuild')"
+                    )
+
+            cls.search_enabled = True
+
+        except OperationalError as e:
+            logger.warning("Busca local de filmes desativada: %s", e)
+
+    @staticmethod
+    def search_expression(query: str):
+        """Converte o texto buscado em uma expressão do FTS5.
+
+        Todas as palavras devem estar presentes e a última é buscada como
+        prefixo, permitindo a busca enquanto o usuário digita.
+        """
+        words = re.findall(r"\w+", query or "")
+
+        if not words:
+            return None
+
+        terms = [f'"{word}"' for word in words]
+        terms[-1] += "*"
+
+        return " ".join(terms)
+
+    @classmethod
+    def search(
+        cls,
+        session,
+        query: str,
+        page: int = 1,
+        per_page: int = 10,
+        year: str = None,
+        type: str = None,
+    ):
+        """Busca os filmes guardados por título, atores, diretor e gênero.
+
+        Os resultados são ordenados por relevância (bm25), com mais peso
+        para o título.
+
+        Retorna o total de filmes encontrados e os filmes da página.
+        """
+        expression = cls.search_expression(query)
+
+        if not cls.search_enabled or expression is None:
+            return 0, []
+
+        filters = ""
+        params = {"expression": expression}
+
+        if year:
+            filters += " AND movie.year = :year"
+            params["year"] = year
+
+        if type:
+            filters += " AND movie.type = :type"
+            params["type"] = type
+
+        source = (
+            " FROM movie_search"
+            " JOIN movie ON movie.rowid = movie_search.rowid"
+            " WHERE movie_search MATCH :expression" + filters
+        )
+
+        total = session.execute(
+            text("SELECT COUNT(*)" + source), params
+        ).scalar()
+
+        if not total:
+            return 0, []
+
+        rows = session.execute(
+            text(
+                "SELECT movie.imdb_id" + source
+                + " ORDER BY bm25(movie_search, 10.0, 2.0, 2.0, 1.0)"
+                " LIMIT :limit OFFSET :offset"
+            ),
+            {**params, "limit": per_page, "offset": (page - 1) * per_page},
+        )
+        imdb_ids = [imdb_id for (imdb_id,) in rows]
+
+        # carrega os filmes mantendo a ordem de relevância
+        movies = {
+            movie.imdb_id: movie
+            for movie in session.query(cls).filter(cls.imdb_id.in_(imdb_ids))
+        }
+
+        return total, [movies[imdb_id] for imdb_id in imdb_ids]
+
+    def to_preview(self):
+        """Retorna o filme no formato de um resultado de busca do OMDb."""
+        return {
+            "Title": self.title,
+            "Year": self.year,
+            "imdbID": self.imdb_id,
+            "Type": self.type,
+            "Poster": self.poster,
+        }
+
+    def to_dict(self, fields: List[str] = None):
+        """Retorna o filme no mesmo formato da resposta do OMDb.
+
+        Arguments:
+            fields (optional): campos retornados; todos, se não informado.
+        """
+        if fields is None:
+            fields = list(self.omdb_fields) + ["Response"]
+
+        result = {
+            field: getattr(self, self.omdb_fields[field])
+            for field in fields
+            if field in self.omdb_fields
+        }
+
+        if "Ratings" in result:
+            result["Ratings"] = json.loads(self.ratings or "[]")
+
+        if "Response" in fields:
+            result["Response"] = "True"
+
+        return result
+
+    def __repr__(self):
+        """Retorna uma representação do Filme em forma de texto."""
+        return f"Movie(imdb_id='{self.imdb_id}', title='{self.title}')"
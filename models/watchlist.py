@@ -23,7 +23,11 @@ class Watchlist(Base):
 
     # A data de inserção será o instante de inserção caso não tenha
     # um valor definido pelo usuário
-    created_at = Column(DateTime, default=datetime.now())
+    created_at = Column(DateTime, default=datetime.now, index=True)
+
+    # versão da lista, incrementada a cada alteração da lista ou dos seus
+    # filmes, usada como ETag nas consultas
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     movies = relationship(
         "AddedMovie",
@@ -71,6 +75,35 @@ class Watchlist(Base):
         return f"Watchlist(id={self.id}, name='{self.name}',\
             description='{self.description}', created_at='{self.created_at}')"
 
+    @staticmethod
+    def make_etag(id: int, created_at: datetime, version: int):
+        """Monta o ETag de uma versão da lista.
+
+        A data de criação diferencia as listas que reaproveitam o id de uma
+        lista removida.
+        """
+        created = int(created_at.timestamp() * 1000000) if created_at else 0
+        return f"watchlist-{id}-{created}-{version}"
+
+    @property
+    def etag(self):
+        """Retorna o ETag da versão atual da lista."""
+        return self.make_etag(self.id, self.created_at, self.version)
+
+    @staticmethod
+    def touch(session, watchlist_ids):
+        """Incrementa a versão das listas informadas.
+
+        As alterações só são efetivadas no commit da sessão.
+        """
+        query = session.query(Watchlist).filter(
+            Watchlist.id.in_(watchlist_ids)
+        )
+        query.update(
+            {Watchlist.version: Watchlist.version + 1},
+            synchronize_session=False,
+        )
+
     def add_movie(self, movie: AddedMovie):
         """Adiciona um novo filme à lista."""
         self.movies.append(movie)
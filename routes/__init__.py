@@ -1,2 +1,3 @@
 from routes.movie import movie_bp
 from routes.watchlist import watchlist_bp
+from routes.metrics import metrics_bp
@@ -0,0 +1,163 @@
+from flask import Response, g, request
+from flask_openapi3 import APIBlueprint
+import time
+
+from metrics import (
+    db_queries,
+    db_queries_per_request,
+    db_query_time,
+    db_repeated_queries,
+    http_request_duration,
+    http_requests,
+    registry,
+)
+from models import pool_stats, query_stats
+from services import omdb_api, sync_http_client, top100_api
+
+metrics_bp = APIBlueprint("metrics", __name__)
+
+
+def route_label():
+    """Retorna a rota da requisição, sem os valores dos parâmetros."""
+    if request.url_rule is None:
+        return "<sem rota>"
+
+    return request.url_rule.rule
+
+
+@metrics_bp.before_app_request
+def start_timer():
+    """Marca o início da requisição."""
+    g.request_started = time.monotonic()
+
+
+@metrics_bp.after_app_request
+def record_request(response):
+    """Registra a duração, o status e as consultas da requisição."""
+    started = g.pop("request_started", None)
+
+    if started is None:
+        return response
+
+    route = route_label()
+    queries = g.get("db_queries", 0)
+
+    http_requests.inc(
+        method=request.method, route=route, status=response.status_code
+    )
+    http_request_duration.observe(
+        time.monotonic() - started, method=request.method, route=route
+    )
+    db_queries.inc(queries, method=request.method, route=route)
+    db_queries_per_request.observe(
+        queries, method=request.method, route=route
+    )
+
+    db_query_time.inc(
+        g.get("db_time", 0.0), method=request.method, route=route
+    )
+
+    if query_stats.repeated():
+        db_repeated_queries.inc(method=request.method, route=route)
+
+    return response
+
+
+@registry.callback(
+    "movie_cache_requests_total",
+    "Consultas ao cache de filmes do OMDb, por resultado.",
+    "counter",
+)
+def movie_cache_requests():
+    """Retorna as consultas ao cache por resultado."""
+    stats = omdb_api.cache.stats()
+    return [
+        ({"result": "memory_hit"}, stats["memory_hits"]),
+        ({"result": "disk_hit"}, stats["disk_hits"]),
+        ({"result": "miss"}, stats["misses"]),
+        ({"result": "wait_hit"}, stats["wait_hits"]),
+    ]
+
+
+@registry.callback(
+    "movie_cache_hit_ratio", "Fração das consultas ao cache atendidas."
+)
+def movie_cache_hit_ratio():
+    """Retorna a taxa de acerto do cache de filmes."""
+    return omdb_api.cache.stats()["hit_ratio"]
+
+
+@registry.callback(
+    "movie_cache_memory_entries", "Filmes guardados no cache em memória."
+)
+def movie_cache_memory_entries():
+    """Retorna a quantidade de filmes no cache em memória."""
+    return omdb_api.cache.stats()["memory_entries"]
+
+
+@registry.callback(
+    "upstream_calls_merged_total",
+    "Buscas ao OMDb agrupadas a uma busca idêntica em andamento.",
+    "counter",
+)
+def upstream_calls_merged():
+    """Retorna as buscas atendidas pelo SingleFlight."""
+    return omdb_api.flight.stats()["merged"]
+
+
+@registry.callback(
+    "upstream_connections_opened_total",
+    "Conexões abertas com as APIs externas, por host.",
+    "counter",
+)
+def upstream_connections_opened():
+    """Retorna as conexões abertas pelo pool de cada host."""
+    return [
+        ({"host": pool["host"]}, pool["connections_opened"])
+        for pool in sync_http_client.stats()
+    ]
+
+
+@registry.callback(
+    "db_pool_checked_out", "Conexões do banco em uso no momento."
+)
+def db_pool_checked_out():
+    """Retorna as conexões do pool em uso."""
+    return pool_stats.stats().get("checked_out", 0)
+
+
+@registry.callback(
+    "db_pool_wait_seconds_total",
+    "Tempo total de espera por uma conexão do pool do banco.",
+    "counter",
+)
+def db_pool_wait_seconds():
+    """Retorna o tempo acumulado de espera por conexões."""
+    return pool_stats.stats()["wait_time_total"]
+
+
+@registry.callback(
+    "db_pool_slow_checkouts_total",
+    "Conexões do banco retidas por mais tempo que DB_SLOW_CHECKOUT.",
+    "counter",
+)
+def db_pool_slow_checkouts():
+    """Retorna as conexões retidas por muito tempo."""
+    return pool_stats.stats()["slow_checkouts"]
+
+
+@registry.callback(
+    "top100_snapshot_age_seconds", "Idade da lista do top 100 em uso."
+)
+def top100_snapshot_age():
+    """Retorna a idade do snapshot do top 100 (-1 se não houver)."""
+    age = top100_api.age()
+    return -1 if age is None else age
+
+
+@metrics_bp.get("/metrics", doc_ui=False)
+def get_metrics():
+    """Expõe as métricas da API no formato de texto do Prometheus."""
+    return Response(
+        registry.collect(), mimetype="text/plain; version=0.0.4"
+    )
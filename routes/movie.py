@@ -1,16 +1,14 @@
+from flask import current_app
 from flask_openapi3 import Tag, APIBlueprint
 
 from schemas import *
 from schemas import ErrorSchema
 
 from logger import logger
-from models import Session, Watchlist, AddedMovie
+from models import Session, Watchlist, AddedMovie, Movie
 from sqlalchemy.exc import IntegrityError
 
-from services import MDbApi, Top100Api
-
-mdb_api = MDbApi()
-top100_api = Top100Api()
+from services import async_http_client, omdb_api, top100_api
 
 movie_tag = Tag(
     name="Movie",
@@ -30,16 +28,25 @@ movie_bp = APIBlueprint("movie", __name__)
 )
 def get_top_100():
     """Busca os 100 filmes mais populares na iMDB."""
-    logger.info(f"Buscando filmes ")
-    # fazendo a busca
-    movies = top100_api.get_movies()
+    logger.info("Buscando filmes ")
+    # o snapshot é servido direto; só a primeira busca, sem snapshot,
+    # aguarda o serviço no event loop do cliente HTTP
+    movies = top100_api.cached_movies()
+    if movies is None:
+        movies = async_http_client.run(top100_api.get_movies_async())
+
+    # informa a idade do snapshot servido
+    headers = {
+        "Age": str(int(top100_api.age() or 0)),
+        "X-Snapshot-Refreshed-At": top100_api.refreshed_at().isoformat(),
+    }
 
     if not movies:
         # se não há filmes cadastrados
-        return {"filmes": []}, 200
+        return {"filmes": []}, 200, headers
     else:
-        logger.info(f"Filme encontrado")
-        return movies, 200
+        logger.info("Filme encontrado")
+        return movies, 200, headers
 
 
 @movie_bp.get(
@@ -51,17 +58,38 @@ def get_top_100():
     },
 )
 def search_movies(query: MovieSearchSchema):
-    """Faz a busca por filmes na API."""
-    logger.info(f"Buscando filmes ")
-    # fazendo a busca
-    movies = mdb_api.get_movies(dict(query))
+    """Faz a busca por filmes.
+
+    A busca é feita primeiro no índice local dos filmes já guardados na
+    base, aceitando prefixos, e só vai à API quando nada é encontrado.
+    """
+    logger.info("Buscando filmes ")
+
+    page = int(query.page) if query.page and query.page.isdigit() else 1
+
+    # fazendo a busca local
+    total, movies = Movie.search(
+        Session(), query.s, page=page, year=query.y, type=query.tipo
+    )
+
+    if total:
+        logger.info("Filme encontrado na base")
+        return {
+            "Search": [movie.to_preview() for movie in movies],
+            "totalResults": str(total),
+            "Response": "True",
+        }, 200
+
+    # fazendo a busca na API; apenas a espera pela resposta roda no event
+    # loop do cliente HTTP
+    movies = async_http_client.run(omdb_api.get_movies_async(dict(query)))
 
     if movies["Response"] == "False":
-        logger.error(f"Filme não encontrado")
+        logger.error("Filme não encontrado")
 
         return movies, 404
 
-    logger.info(f"Filme encontrado")
+    logger.info("Filme encontrado")
     return movies, 200
 
 
@@ -73,19 +101,45 @@ def search_movies(query: MovieSearchSchema):
         "404": ErrorSchema,
     },
 )
-def search_movie(path: MovieByIdSchema):
-    """Busca por um filme específico na API."""
-    logger.info(f"Buscando filme ")
+def search_movie(path: MovieByIdSchema, query: MovieFieldsSchema):
+    """Busca por um filme específico na API.
+
+    Com o parâmetro fields, o filme traz apenas os campos informados. Se
+    eles estiverem todos na prévia do filme (Title, Year, imdbID, Type e
+    Poster), ela é lida do cache ou da base sem buscar os detalhes na API.
+    """
+    logger.info("Buscando filme ")
 
     imdb_id = path.imdb_id
+    fields = query.field_list()
+
+    if fields and PREVIEW_FIELDS.issuperset(fields):
+        movie = omdb_api.get_preview(imdb_id, fields)
+
+        if movie is None:
+            stored = Session().get(Movie, imdb_id)
+            movie = stored.to_preview() if stored else None
+
+        if movie is not None:
+            logger.info("Prévia do filme encontrada")
+            return select_fields(movie, fields), 200
 
     # fazendo a busca
-    movie = mdb_api.get_movie_by_id(imdb_id)
+    movie = async_http_client.run(omdb_api.get_movie_by_id_async(imdb_id))
 
     if movie["Response"] == "False":
-        logger.error(f"Filme não encontrado")
+        logger.error("Filme não encontrado")
 
         return movie, 404
 
-    logger.info(f"Filme encontrado")
-    return movie, 200
+    # guarda o filme na base, tornando-o disponível para a busca local;
+    # se ele já estiver guardado e atualizado, nada é escrito
+    session = Session()
+    max_age = current_app.extensions["movie_refresher"].max_age
+
+    if not Movie.is_fresh(session, imdb_id, max_age):
+        Movie.upsert(session, [movie])
+        session.commit()
+
+    logger.info("Filme encontrado")
+    return select_fields(movie, fields), 200
@@ -0,0 +1,51 @@
+from flask import request
+from werkzeug.http import quote_etag
+
+
+def etag_headers(etag: str):
+    """Retorna os cabeçalhos de cache de uma resposta com o ETag informado.
+
+    O no-cache obriga o cliente a revalidar a resposta a cada consulta, o
+    que é barato graças ao If-None-Match.
+    """
+    return {"ETag": quote_etag(etag), "Cache-Control": "no-cache"}
+
+
+def cache_headers(etag: str, stored: bool = True):
+    """Retorna os cabeçalhos de cache de uma representação de lista.
+
+    Uma representação com filmes que não estão guardados na base, como as
+    respostas de erro do OMDb, pode mudar sem que a versão da lista mude.
+    Ela não recebe ETag e não deve ser guardada pelo cliente.
+    """
+    if not stored:
+        return {"Cache-Control": "no-store"}
+
+    return etag_headers(etag)
+
+
+def variant_etag(etag: str, **params):
+    """Retorna o ETag de uma variação da representação.
+
+    Os parâmetros que mudam a representação, como os campos selecionados,
+    entram no ETag, de modo que cada variação tenha o seu. Os parâmetros
+    nulos são ignorados.
+    """
+    variant = [
+        f"{name}={value}"
+        for name, value in sorted(params.items())
+        if value is not None
+    ]
+    return ";".join([etag, *variant])
+
+
+def not_modified(etag: str):
+    """Retorna uma resposta 304 se o cliente já possui a versão do ETag.
+
+    Assim como define o HTTP, o If-None-Match usa a comparação fraca.
+    Retorna None caso ele não corresponda ao ETag.
+    """
+    if not request.if_none_match.contains_weak(etag):
+        return None
+
+    return "", 304, etag_headers(etag)
@@ -4,8 +4,19 @@ from schemas import *
 from schemas import ErrorSchema
 
 from logger import logger
+from routes.utils import (
+    cache_headers,
+    etag_headers,
+    not_modified,
+    variant_etag,
+)
 from models import Session, Watchlist, AddedMovie
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from datetime import datetime
+from typing import List
+import hashlib
 
 watchlist_tag = Tag(
     name="Watchlist",
@@ -14,6 +25,88 @@ watchlist_tag = Tag(
 
 watchlist_bp = APIBlueprint("watchlist", __name__)
 
+# quantidade máxima de linhas por INSERT na adição em lote
+BULK_INSERT_BATCH_SIZE = 500
+
+
+# resultados possíveis da adição de um filme a uma lista
+ADDED = "added"
+ALREADY_ADDED = "already_added"
+WATCHLIST_NOT_FOUND = "watchlist_not_found"
+
+
+def add_movies(session, imdb_ids: List[str], watchlist_ids: List[int]):
+    """Adiciona cada filme a cada lista em uma única transação.
+
+    Os pares que já existem são ignorados pelo próprio banco, por meio do
+    ON CONFLICT sobre a restrição added_movie_unique_id.
+
+    Retorna o resultado da adição de cada par filme x lista.
+    """
+    # removendo repetições, mantendo a ordem informada
+    imdb_ids = list(dict.fromkeys(imdb_ids))
+    watchlist_ids = list(dict.fromkeys(watchlist_ids))
+
+    found_ids = {
+        id
+        for (id,) in session.query(Watchlist.id).filter(
+            Watchlist.id.in_(watchlist_ids)
+        )
+    }
+
+    existing = set(
+        session.query(AddedMovie.imdb_id, AddedMovie.watchlist_id).filter(
+            AddedMovie.imdb_id.in_(imdb_ids),
+            AddedMovie.watchlist_id.in_(found_ids),
+        )
+    )
+
+    results = []
+    new_rows = []
+    now = datetime.now()
+
+    for imdb_id in imdb_ids:
+        for watchlist_id in watchlist_ids:
+            if watchlist_id not in found_ids:
+                status = WATCHLIST_NOT_FOUND
+            elif (imdb_id, watchlist_id) in existing:
+                status = ALREADY_ADDED
+            else:
+                status = ADDED
+                new_rows.append(
+                    {
+                        "imdb_id": imdb_id,
+                        "watchlist_id": watchlist_id,
+                        "created_at": now,
+                    }
+                )
+
+            results.append(
+                {
+                    "imdb_id": imdb_id,
+                    "watchlist_id": watchlist_id,
+                    "status": status,
+                }
+            )
+
+    # insere em lotes para respeitar o limite de parâmetros do sqlite
+    for i in range(0, len(new_rows), BULK_INSERT_BATCH_SIZE):
+        statement = (
+            sqlite_insert(AddedMovie.__table__)
+            .values(new_rows[i:i + BULK_INSERT_BATCH_SIZE])
+            .on_conflict_do_nothing(index_elements=["imdb_id", "watchlist_id"])
+        )
+        session.execute(statement)
+
+    # as listas que receberam filmes mudam de versão
+    if new_rows:
+        Watchlist.touch(session, {row["watchlist_id"] for row in new_rows})
+
+    # efetivando todas as inserções de uma só vez
+    session.commit()
+
+    return results
+
 
 @watchlist_bp.post(
     "/watchlist",
@@ -33,7 +126,7 @@ def add_watchlist(form: WatchlistSchema):
         name=form.name,
         description=form.description,
     )
-    logger.info(f"Adicionando nova lista de name: '{watchlist.name}'")
+    logger.info("Adicionando nova lista de name: '%s'", watchlist.name)
     try:
         # criando conexão com a base
         session = Session()
@@ -41,14 +134,16 @@ def add_watchlist(form: WatchlistSchema):
         session.add(watchlist)
         # efetivando o camando de adição de novo item na tabela
         session.commit()
-        logger.info("Adicionado lista: %s" % watchlist)
-        return render_watchlist(watchlist), 200
+        logger.info("Adicionado lista: %s", watchlist)
+
+        result, stored = render_watchlist(watchlist)
+        return result, 200, cache_headers(watchlist.etag, stored)
 
     except IntegrityError as e:
         # como a duplicidade do name é a provável razão do IntegrityError
         error_msg = "Lista de mesmo name já salva na base :/"
         logger.warning(
-            f"Erro ao adicionar lista '{watchlist.name}', {error_msg}"
+            "Erro ao adicionar lista '%s', %s", watchlist.name, error_msg
         )
         return {"message": error_msg}, 409
 
@@ -56,7 +151,7 @@ def add_watchlist(form: WatchlistSchema):
         # caso um erro fora do previsto
         error_msg = "Não foi possível salvar nova lista :/"
         logger.warning(
-            f"Erro ao adicionar lista '{watchlist.name}', {error_msg}"
+            "Erro ao adicionar lista '%s', %s", watchlist.name, error_msg
         )
         return {"message": error_msg}, 400
 
@@ -66,24 +161,86 @@ def add_watchlist(form: WatchlistSchema):
     tags=[watchlist_tag],
     responses={"200": WatchlistListSchema, "404": ErrorSchema},
 )
-def get_watchlists():
-    """Faz a busca por todas as listas de filmes cadastradas.
+def get_watchlists(query: WatchlistListQuerySchema):
+    """Faz a busca pelas listas de filmes cadastradas.
+
+    As listas são ordenadas pelo ID e paginadas por cursor, podendo ser
+    filtradas pelo prefixo do nome, pela data de criação e por um filme.
 
-    Retorna uma representação das listas de filmes cadastradas.
+    Retorna uma representação das listas de filmes encontradas.
     """
-    logger.info(f"Coletando listas de filmes cadastradas")
+    logger.info("Coletando listas de filmes cadastradas")
     # criando conexão com a base
     session = Session()
-    # fazendo a busca
-    watchlists = session.query(Watchlist).all()
 
-    if not watchlists:
+    # seleciona os ids da página, buscando um item a mais para saber se
+    # existe uma próxima página
+    page = session.query(
+        Watchlist.id, Watchlist.created_at, Watchlist.version
+    )
+
+    if query.after is not None:
+        page = page.filter(Watchlist.id > query.after)
+
+    if query.name:
+        # intervalo equivalente ao prefixo, que aproveita o índice do nome
+        page = page.filter(
+            Watchlist.name >= query.name,
+            Watchlist.name < query.name + "\U0010ffff",
+        )
+
+    if query.created_after:
+        page = page.filter(Watchlist.created_at > query.created_after)
+
+    if query.imdb_id:
+        page = page.filter(
+            Watchlist.movies.any(AddedMovie.imdb_id == query.imdb_id)
+        )
+
+    page = page.order_by(Watchlist.id).limit(query.limit + 1).all()
+
+    # a página só muda quando alguma das suas listas muda de versão ou
+    # quando o conjunto de listas muda, então o ETag é o hash das versões
+    etag = hashlib.sha1(
+        ",".join(Watchlist.make_etag(*item) for item in page).encode()
+    ).hexdigest()
+
+    response = not_modified(etag)
+    if response:
+        logger.debug("Listas de filmes não modificadas")
+        return response
+
+    # fazendo a busca das listas e dos ids dos filmes em uma única consulta
+    rows = (
+        session.query(
+            Watchlist.id,
+            Watchlist.name,
+            Watchlist.description,
+            AddedMovie.imdb_id,
+        )
+        .filter(Watchlist.id.in_([id for id, _, _ in page]))
+        .outerjoin(Watchlist.movies)
+        .order_by(Watchlist.id, AddedMovie.id)
+        .all()
+    )
+
+    if not rows:
         # se não há watchlists cadastradas
-        return {"watchlists": []}, 200
+        return {"watchlists": [], "next": None}, 200, etag_headers(etag)
     else:
-        logger.info(f"%d watchlist econtrados" % len(watchlists))
+        result = render_watchlist_rows(rows)
+        watchlists = result["watchlists"]
+
+        # o item a mais indica que existe uma próxima página
+        if len(watchlists) > query.limit:
+            del watchlists[query.limit:]
+            result["next"] = watchlists[-1]["id"]
+        else:
+            result["next"] = None
+
+        logger.info("%d watchlist econtrados", len(watchlists))
         # retorna a representação das listas
-        return render_watchlists(watchlists), 200
+        return result, 200, etag_headers(etag)
 
 
 @watchlist_bp.get(
@@ -91,14 +248,24 @@ def get_watchlists():
     tags=[watchlist_tag],
     responses={"200": WatchlistDetailsSchema, "404": ErrorSchema},
 )
-def get_watchlist(path: WatchlistByIDSchema):
+def get_watchlist(
+    path: WatchlistByIDSchema, query: WatchlistDetailQuerySchema
+):
     """Busca uma lista específica à partir do id.
 
-    Retorna uma representação da lista.
+    Retorna uma representação da lista. Com o parâmetro fields, cada filme
+    traz apenas os campos informados; se eles estiverem todos nas prévias
+    dos filmes (Title, Year, imdbID, Type e Poster), os detalhes dos filmes
+    que faltam na base não são buscados no OMDb.
+
+    Com o parâmetro limit, os filmes são paginados e apenas os da página
+    são buscados; o campo next da resposta é o cursor da página seguinte.
+    Cada exibição busca no máximo MOVIE_FETCH_LIMIT filmes, e a resposta
+    com filmes ainda não buscados não recebe ETag.
     """
     watchlist_id = path.id
 
-    logger.debug(f"Coletando lista com ID: {watchlist_id} ")
+    logger.debug("Coletando lista com ID: %s ", watchlist_id)
 
     # criando conexão com a base
     session = Session()
@@ -113,16 +280,47 @@ def get_watchlist(path: WatchlistByIDSchema):
     if not watchlist:
         # se a lista não foi encontrado
         error_msg = "Lista não encontrada na base :/"
-        log_error_msg = (
-            f"Erro ao buscar lista com ID: #'{watchlist_id}', {error_msg}"
+        logger.warning(
+            "Erro ao buscar lista com ID: #'%s', %s", watchlist_id, error_msg
         )
-
-        logger.warning(log_error_msg)
         return {"message": error_msg}, 404
     else:
-        logger.debug(f"Lista com ID: #{watchlist_id} encontrado com sucesso")
+        logger.debug("Lista com ID: #%s encontrado com sucesso", watchlist_id)
+
+        # cada seleção de campos e página é uma representação, com o seu
+        # ETag
+        etag = variant_etag(
+            watchlist.etag,
+            fields=query.fields,
+            limit=query.limit,
+            after=query.after,
+        )
+
+        # o cliente já possui a versão atual: nem os filmes são buscados
+        response = not_modified(etag)
+        if response:
+            return response
+
+        # monta a representação da lista, buscando os filmes que faltam
+        # no event loop do cliente HTTP
+        result, stored = render_watchlist(
+            watchlist,
+            query.field_list(),
+            query.limit,
+            query.after,
+            fetch=fetch_movies_on_loop,
+        )
+
+        # guardar os filmes buscados muda a versão da lista
+        etag = variant_etag(
+            watchlist.etag,
+            fields=query.fields,
+            limit=query.limit,
+            after=query.after,
+        )
+
         # retorna a representação da lista
-        return render_watchlist(watchlist), 200
+        return result, 200, cache_headers(etag, stored)
 
 
 @watchlist_bp.put(
@@ -151,16 +349,17 @@ def put_watchlist(form: WatchlistUpdateSchema):
         session.query(Watchlist).filter(Watchlist.id == watchlist_id).first()
     )
 
-    logger.debug(f"Editando lista de ID: '{old_watchlist.id}'")
+    logger.debug("Editando lista de ID: '%s'", old_watchlist.id)
 
     try:
         # edita os valores do lista
         old_watchlist.name = watchlist.name
         old_watchlist.description = watchlist.description
+        old_watchlist.version = Watchlist.version + 1
 
         # efetivando o comando de edição do lista na tabela
         session.commit()
-        logger.debug(f"Editado lista de ID: '{watchlist.name}'")
+        logger.debug("Editado lista de ID: '%s'", watchlist.name)
 
         # fazendo a busca
         watchlist = (
@@ -169,25 +368,24 @@ def put_watchlist(form: WatchlistUpdateSchema):
             .one_or_none()
         )
 
-        return render_watchlist(watchlist), 200
+        result, stored = render_watchlist(watchlist)
+        return result, 200, cache_headers(watchlist.etag, stored)
 
     except IntegrityError as e:
         # como a duplicidade do título é a provável razão do IntegrityError
         error_msg = "Artigo de mesmo título já salvo na base :/"
-        log_error_msg = (
-            f"Erro ao adicionar lista '{watchlist.name}', {error_msg}"
+        logger.warning(
+            "Erro ao adicionar lista '%s', %s", watchlist.name, error_msg
         )
-        logger.warning(log_error_msg)
 
         return {"message": error_msg}, 409
 
     except Exception as e:
         # caso um erro fora do previsto
         error_msg = "Não foi possível salvar novo lista :/"
-        log_error_msg = (
-            f"Erro ao adicionar lista '{watchlist.name}', {error_msg}"
+        logger.warning(
+            "Erro ao adicionar lista '%s', %s", watchlist.name, error_msg
         )
-        logger.warning(log_error_msg)
 
         return {"message": error_msg}, 400
 
@@ -204,7 +402,7 @@ def delete_watchlist(path: WatchlistByIDSchema):
     """
     watchlist_id = path.id
 
-    logger.debug(f"Removendo lista com ID: #{watchlist_id}")
+    logger.debug("Removendo lista com ID: #%s", watchlist_id)
 
     # criando conexão com a base
     session = Session()
@@ -218,15 +416,14 @@ def delete_watchlist(path: WatchlistByIDSchema):
 
     if count:
         # retorna a representação da mensagem de confirmação
-        logger.debug(f"Lista com ID: #{watchlist_id} excluída com sucesso")
+        logger.debug("Lista com ID: #%s excluída com sucesso", watchlist_id)
         return {"message": "Lista removida", "id": watchlist_id}
     else:
         # se o lista não foi encontrado
         error_msg = "Lista não encontrada na base :/"
-        log_error_msg = (
-            f"Erro ao remover lista com ID: '{watchlist_id}', {error_msg}"
+        logger.warning(
+            "Erro ao remover lista com ID: '%s', %s", watchlist_id, error_msg
         )
-        logger.warning(log_error_msg)
 
         return {"message": error_msg}, 404
 
@@ -250,60 +447,82 @@ def add_movie_to_watchlists(form: WatchlistAddMovieSchema):
     # criando conexão com a base
     session = Session()
 
-    # fazendo a busca pelas listas
-    watchlists = (
-        session.query(Watchlist).filter(Watchlist.id.in_(watchlist_ids)).all()
-    )
+    logger.info("Adicionando filme às listas")
 
-    if not watchlists:
+    # adicionando o filme a todas as listas em uma única transação
+    results = add_movies(session, [form.imdb_id], watchlist_ids)
+
+    if all(r["status"] == WATCHLIST_NOT_FOUND for r in results):
         # se a lista não foi encontrado
         error_msg = "Lista não encontrada na base :/"
-        log_error_msg = f"Erro ao buscar lista com IDS, {error_msg}"
-        logger.warning(log_error_msg)
+        logger.warning("Erro ao buscar lista com IDS, %s", error_msg)
         return {"message": error_msg}, 404
 
-    logger.info(f"Adicionando filme às listas")
+    # guardando os detalhes do filme, já fora da transação da adição
+    if any(r["status"] == ADDED for r in results):
+        store_movies(session, [form.imdb_id])
 
-    try:
-        # adicionando filme às listas
-        for watchlist in watchlists:
-            # checando se o filme já foi adicionado à lista
-            for movie in watchlist.movies:
-                if movie.imdb_id == form.imdb_id:
-                    error_msg = "Filme já adicionado à lista :/"
-                    logger.warning(
-                        f"Erro ao adicionar lista '{watchlist.name}', {error_msg}"
-                    )
-
-                    break
+    for result in results:
+        if result["status"] == ALREADY_ADDED:
+            error_msg = "Filme já adicionado à lista :/"
+            logger.warning(
+                "Erro ao adicionar lista #%s, %s",
+                result["watchlist_id"],
+                error_msg,
+            )
 
-            else:
-                # criando filme
-                movie = AddedMovie(form.imdb_id)
-                watchlist.add_movie(movie)
+    logger.info("Adicionado filme às listas")
 
-                # efetivando o comando de adição de novo item na tabela
-                session.commit()
+    # fazendo a busca pelas listas
+    watchlists = (
+        session.query(Watchlist)
+        .options(selectinload(Watchlist.movies))
+        .filter(Watchlist.id.in_(watchlist_ids))
+        .all()
+    )
 
-        logger.info(f"Adicionado filme às listas")
+    # retorna a representação da lista
+    return render_watchlists(watchlists), 200
 
-        # retorna a representação da lista
-        return render_watchlists(watchlists), 200
 
-    except IntegrityError as e:
-        # como a duplicidade do name é a provável razão do IntegrityError
-        error_msg2 = "Filme já adicionado à lista :/"
-        logger.warning(
-            f"Erro ao adicionar lista '{watchlist.name}', {error_msg2}"
-        )
-        return {"message": error_msg2}, 409
+@watchlist_bp.post(
+    "/watchlist/movies/bulk",
+    tags=[watchlist_tag],
+    responses={"200": WatchlistBulkAddViewSchema, "422": ErrorSchema},
+)
+def bulk_add_movies_to_watchlists(body: WatchlistBulkAddSchema):
+    """Adiciona vários filmes a várias listas de uma só vez.
+
+    Todos os pares filme x lista são inseridos em uma única transação e os
+    pares já existentes são ignorados. Os detalhes dos filmes não são
+    buscados aqui, e sim na primeira exibição de cada lista, para que uma
+    importação grande não gaste a cota do OMDb de uma só vez. Cada
+    requisição aceita até 100 filmes e 20 listas.
+
+    Retorna o resultado da inserção de cada par.
+    """
+    # criando conexão com a base
+    session = Session()
+
+    logger.info(
+        "Adicionando %s filmes a %s listas",
+        len(body.imdb_ids),
+        len(body.watchlist_ids),
+    )
+
+    results = add_movies(session, body.imdb_ids, body.watchlist_ids)
+    added = sum(r["status"] == ADDED for r in results)
+
+    logger.info("Adicionados %s filmes às listas", added)
+
+    return {"added": added, "results": results}, 200
 
 
 @watchlist_bp.get(
     "/watchlist/movie/<string:imdb_id>",
     tags=[watchlist_tag],
     responses={
-        "200": WatchlistDetailsSchema,
+        "200": MovieWatchlistsViewSchema,
         "409": ErrorSchema,
         "400": ErrorSchema,
     },
@@ -311,30 +530,61 @@ def add_movie_to_watchlists(form: WatchlistAddMovieSchema):
 def get_movie_watchlists(path: MovieWatchlistGetSchema):
     """Busca pelas listas que um filme pertence.
 
-    Retorna uma representação da lista e seus filmes.
+    Retorna uma representação do filme e os ids das suas listas.
     """
     imdb_id = path.imdb_id
 
     # Criando conexão com a base de dados
     session = Session()
 
-    # Buscando todas as vezes que o filme foi adicionado à lista
-    movies = (
-        session.query(AddedMovie).filter(AddedMovie.imdb_id == imdb_id).all()
-    )
+    # Buscando apenas os ids das listas, a consulta é respondida
+    # diretamente pelo índice único (imdb_id, watchlist_id)
+    watchlist_ids = [
+        watchlist_id
+        for (watchlist_id,) in session.query(AddedMovie.watchlist_id)
+        .filter(AddedMovie.imdb_id == imdb_id)
+        .order_by(AddedMovie.watchlist_id)
+    ]
 
-    if not movies:
-        # Se o filme não foi encontrado
-        # retorna a representação da lista
-        render_movie_watchlists(imdb_id, []), 204
+    # retorna a representação da lista
+    return render_movie_watchlists(imdb_id, watchlist_ids), 200
 
-    watchlists = []
 
-    for movie in movies:
-        watchlists.append(movie.watchlist)
+@watchlist_bp.get(
+    "/watchlist/movie",
+    tags=[watchlist_tag],
+    responses={"200": MovieWatchlistsListSchema},
+)
+def get_movies_watchlists(query: MovieWatchlistsQuerySchema):
+    """Busca pelas listas que cada um dos filmes informados pertence.
 
-    # retorna a representação da lista
-    return render_movie_watchlists(imdb_id, watchlists), 200
+    Permite marcar, com uma única chamada, quais filmes de uma página de
+    resultados já estão em alguma lista.
+
+    Retorna os ids das listas de cada filme.
+    """
+    imdb_ids = list(dict.fromkeys(query.imdb_ids))
+
+    # Criando conexão com a base de dados
+    session = Session()
+
+    watchlists = {imdb_id: [] for imdb_id in imdb_ids}
+
+    rows = (
+        session.query(AddedMovie.imdb_id, AddedMovie.watchlist_id)
+        .filter(AddedMovie.imdb_id.in_(imdb_ids))
+        .order_by(AddedMovie.imdb_id, AddedMovie.watchlist_id)
+    )
+
+    for imdb_id, watchlist_id in rows:
+        watchlists[imdb_id].append(watchlist_id)
+
+    return {
+        "movies": [
+            render_movie_watchlists(imdb_id, watchlist_ids)
+            for imdb_id, watchlist_ids in watchlists.items()
+        ]
+    }, 200
 
 
 @watchlist_bp.delete(
@@ -367,13 +617,12 @@ def remove_movie_from_watchlist(path: WatchlistRemoveMovieSchema):
     if not watchlist:
         # Se a lista de reprodução não foi encontrada
         error_msg = "Lista não encontrada na base :/"
-        log_error_msg = (
-            f"Erro ao buscar lista com ID: '{watchlist_id}', {error_msg}"
+        logger.warning(
+            "Erro ao buscar lista com ID: '%s', %s", watchlist_id, error_msg
         )
-        logger.warning(log_error_msg)
         return {"message": error_msg}, 404
 
-    logger.info(f"Removendo filme da lista #{watchlist_id}")
+    logger.info("Removendo filme da lista #%s", watchlist_id)
 
     movie_query = session.query(AddedMovie).filter(
         AddedMovie.imdb_id == imdb_id, AddedMovie.watchlist_id == watchlist_id
@@ -384,17 +633,18 @@ def remove_movie_from_watchlist(path: WatchlistRemoveMovieSchema):
     if not movie:
         # Se o filme não foi encontrado
         error_msg = "Filme não encontrado na lista :/"
-        log_error_msg = (
-            f"Erro ao buscar filme com ID: '{imdb_id}', {error_msg}"
+        logger.warning(
+            "Erro ao buscar filme com ID: '%s', %s", imdb_id, error_msg
         )
-        logger.warning(log_error_msg)
         return {"message": error_msg}, 404
 
     # Removendo o filme da lista
     movie_query.delete()
+    Watchlist.touch(session, [watchlist_id])
     session.commit()
 
-    logger.info(f"Removido filme da lista #{watchlist_id}")
+    logger.info("Removido filme da lista #%s", watchlist_id)
 
     # retorna a representação da lista
-    return render_watchlist(watchlist), 200
+    result, stored = render_watchlist(watchlist)
+    return result, 200, cache_headers(watchlist.etag, stored)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
 from typing import Optional, List
 
 
@@ -61,6 +61,52 @@ class MoviePreview(BaseModel):
     )
 
 
+# campos de um filme na resposta do OMDb
+MOVIE_FIELDS = frozenset(MovieViewSchema.__fields__)
+
+# campos presentes também nos resultados de busca, que dispensam a busca
+# dos detalhes do filme
+PREVIEW_FIELDS = frozenset(MoviePreview.__fields__)
+
+
+class MovieFieldsSchema(BaseModel):
+    """Define os campos de cada filme a serem retornados."""
+
+    fields: Optional[str] = Field(
+        description="Campos de cada filme, separados por vírgula. "
+        "Exemplo: Title,Year,Poster",
+    )
+
+    @validator("fields")
+    def check_fields(cls, value):
+        """Valida os campos informados, em ordem e sem repetições."""
+        if value is None:
+            return None
+
+        names = sorted({name.strip() for name in value.split(",")} - {""})
+        invalid = [name for name in names if name not in MOVIE_FIELDS]
+
+        if invalid:
+            raise ValueError(f"campos inválidos: {', '.join(invalid)}")
+
+        return ",".join(names) or None
+
+    def field_list(self):
+        """Retorna a lista dos campos ou None para todos os campos."""
+        return self.fields.split(",") if self.fields else None
+
+
+def select_fields(movie: dict, fields: List[str] = None):
+    """Retorna o filme apenas com os campos informados.
+
+    As respostas de erro do OMDb são retornadas inteiras.
+    """
+    if not fields or movie.get("Response") == "False":
+        return movie
+
+    return {name: movie[name] for name in fields if name in movie}
+
+
 class MovieSearchSchema(BaseModel):
     """Define como uma busca por um filme será representada."""
 
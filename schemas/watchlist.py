@@ -1,10 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import threading
+from datetime import datetime
 from pydantic import BaseModel, Field
+from sqlalchemy import func
+from sqlalchemy.orm import object_session
 from typing import Optional, List
+
+import config
+from logger import logger
+from models import AddedMovie, Movie
 from models.watchlist import Watchlist
-from schemas import MovieViewSchema
-from services import MDbApi
+from schemas import (
+    PREVIEW_FIELDS,
+    MovieFieldsSchema,
+    MovieViewSchema,
+    select_fields,
+)
+from services import async_http_client, omdb_api
+
+# pool de threads compartilhado pelas buscas dos filmes das listas em
+# paralelo, criado na primeira busca de cada processo
+_movie_lookup_executor = None
+_movie_lookup_pid = None
+_movie_lookup_lock = threading.Lock()
+
+
+def movie_lookup_concurrency():
+    """Quantidade máxima de buscas simultâneas ao OMDb de cada requisição.
+
+    O limite vale para cada exibição de uma lista, e não para o processo:
+    requisições simultâneas fazem, juntas, até MOVIE_LOOKUP_POOL_SIZE
+    buscas ao mesmo tempo.
+    """
+    return config.get_int("MOVIE_LOOKUP_CONCURRENCY", 8)
+
+
+def movie_lookup_pool_size():
+    """Quantidade de threads do pool de buscas, compartilhado no processo."""
+    return config.get_int("MOVIE_LOOKUP_POOL_SIZE", 32)
+
+
+def movie_fetch_limit():
+    """Quantidade máxima de filmes buscados no OMDb em cada exibição.
+
+    Os filmes que passarem do limite são buscados nas exibições seguintes,
+    de modo que uma lista grande recém-importada não seja buscada inteira
+    de uma só vez.
+    """
+    return config.get_int("MOVIE_FETCH_LIMIT", 50)
 
-mdb_api = MDbApi()
+
+def movie_lookup_executor():
+    """Retorna o pool de threads das buscas, criando-o se necessário.
+
+    Após um fork, as threads do pool do processo pai não existem no
+    processo filho, que cria o seu próprio pool.
+    """
+    global _movie_lookup_executor, _movie_lookup_pid
+
+    with _movie_lookup_lock:
+        if _movie_lookup_pid != os.getpid():
+            _movie_lookup_executor = ThreadPoolExecutor(
+                max_workers=movie_lookup_pool_size(),
+                thread_name_prefix="movie-lookup",
+            )
+            _movie_lookup_pid = os.getpid()
+
+    return _movie_lookup_executor
 
 
 class WatchlistSchema(BaseModel):
@@ -42,10 +106,37 @@ class WatchlistByIDSchema(BaseModel):
     id: int = 1
 
 
+class WatchlistListQuerySchema(BaseModel):
+    """Define os filtros e a paginação da listagem de listas de filmes.
+
+    A paginação é feita por cursor: o campo `next` da resposta deve ser
+    enviado como `after` para buscar a página seguinte.
+    """
+
+    limit: int = Field(
+        default=50, ge=1, le=500, description="Quantidade de listas"
+    )
+    after: Optional[int] = Field(
+        description="Retorna apenas as listas com ID maior que este"
+    )
+    name: Optional[str] = Field(
+        description="Retorna apenas as listas cujo nome começa com este"
+    )
+    created_after: Optional[datetime] = Field(
+        description="Retorna apenas as listas criadas após esta data"
+    )
+    imdb_id: Optional[str] = Field(
+        description="Retorna apenas as listas que contêm este filme"
+    )
+
+
 class WatchlistListSchema(BaseModel):
     """Define como uma listagem de lista de filmes será retornada."""
 
     watchlists: List[WatchlistSchema]
+    next: Optional[int] = Field(
+        description="Cursor da próxima página, nulo na última página"
+    )
 
 
 def render_watchlists(watchlists: List[Watchlist]):
@@ -70,6 +161,32 @@ def render_watchlists(watchlists: List[Watchlist]):
     return {"watchlists": result}
 
 
+def render_watchlist_rows(rows):
+    """Retorna uma representação das listas segundo o WatchlistListSchema.
+
+    Recebe as linhas (id, name, description, imdb_id) de uma consulta que
+    junta as listas aos seus filmes, sem carregar os objetos do ORM.
+    """
+    result = {}
+
+    for id, name, description, imdb_id in rows:
+        watchlist = result.get(id)
+
+        if watchlist is None:
+            watchlist = result[id] = {
+                "id": id,
+                "name": name,
+                "description": description,
+                "movies": [],
+            }
+
+        # listas sem filmes aparecem uma única vez com imdb_id nulo
+        if imdb_id is not None:
+            watchlist["movies"].append(imdb_id)
+
+    return {"watchlists": list(result.values())}
+
+
 class WatchlistDetailsSchema(BaseModel):
     """Define como uma lista de filmes será retornada."""
 
@@ -83,6 +200,26 @@ class WatchlistDetailsSchema(BaseModel):
             "Rated": "R",
         }
     ]
+    total: int = Field(default=1, description="Quantidade de filmes na lista")
+    next: Optional[int] = Field(
+        description="Cursor da próxima página de filmes, nulo na última"
+    )
+
+
+class WatchlistDetailQuerySchema(MovieFieldsSchema):
+    """Define os campos e a paginação dos filmes de uma lista.
+
+    A paginação é feita por cursor: o campo `next` da resposta deve ser
+    enviado como `after` para buscar a página seguinte. Sem `limit`, todos
+    os filmes da lista são retornados.
+    """
+
+    limit: Optional[int] = Field(
+        ge=1, le=500, description="Quantidade de filmes"
+    )
+    after: Optional[int] = Field(
+        description="Retorna apenas os filmes adicionados após este cursor"
+    )
 
 
 class WatchlistDeleteSchema(BaseModel):
@@ -92,24 +229,247 @@ class WatchlistDeleteSchema(BaseModel):
     message: str
 
 
-def render_watchlist(watchlist: Watchlist):
-    """Retorna uma representação da lista.
+def fetch_movies(imdb_ids: List[str]):
+    """Busca os detalhes dos filmes no OMDb, na ordem informada.
 
-    Segue o schema definido em WatchlistDetailsSchema.
+    As buscas são feitas em paralelo no pool compartilhado, com no máximo
+    MOVIE_LOOKUP_CONCURRENCY delas em andamento por chamada, de modo que
+    uma lista grande não ocupa o pool inteiro.
     """
-    movies = []
+    executor = movie_lookup_executor()
+    semaphore = threading.BoundedSemaphore(movie_lookup_concurrency())
 
-    for movie in watchlist.movies:
-        movie = mdb_api.get_movie_by_id(movie.imdb_id)
-        movies.append(movie)
+    def fetch(imdb_id):
+        try:
+            return omdb_api.get_movie_by_id(imdb_id)
+        finally:
+            semaphore.release()
 
-    return {
+    futures = []
+
+    for imdb_id in imdb_ids:
+        semaphore.acquire()
+        futures.append(executor.submit(fetch, imdb_id))
+
+    return [future.result() for future in futures]
+
+
+async def fetch_movies_async(imdb_ids: List[str]):
+    """Versão assíncrona do fetch_movies.
+
+    As buscas são feitas no mesmo event loop, com no máximo
+    MOVIE_LOOKUP_CONCURRENCY delas em andamento por chamada.
+    """
+    semaphore = asyncio.Semaphore(movie_lookup_concurrency())
+
+    async def fetch(imdb_id):
+        async with semaphore:
+            return await omdb_api.get_movie_by_id_async(imdb_id)
+
+    return list(await asyncio.gather(*(fetch(i) for i in imdb_ids)))
+
+
+def fetch_movies_on_loop(imdb_ids: List[str]):
+    """Busca os detalhes dos filmes no event loop do cliente HTTP.
+
+    As buscas se sobrepõem no event loop sem ocupar as threads do pool de
+    buscas; a thread que chama apenas aguarda o resultado.
+    """
+    return async_http_client.run(fetch_movies_async(imdb_ids))
+
+
+def store_movies(session, imdb_ids: List[str]):
+    """Guarda na tabela movie os filmes que ainda não estão nela.
+
+    A transação da sessão é encerrada antes das buscas no OMDb, para que
+    a conexão não fique presa durante as requisições, e os filmes buscados
+    são efetivados em uma nova transação. Falhas na busca não impedem a
+    operação: os filmes que não puderem ser buscados agora serão guardados
+    ao exibir a lista.
+    """
+    imdb_ids = list(dict.fromkeys(imdb_ids))
+
+    stored = {
+        imdb_id
+        for (imdb_id,) in session.query(Movie.imdb_id).filter(
+            Movie.imdb_id.in_(imdb_ids)
+        )
+    }
+    missing = [imdb_id for imdb_id in imdb_ids if imdb_id not in stored]
+
+    # devolvendo a conexão ao pool antes das requisições
+    session.commit()
+
+    if not missing:
+        return
+
+    try:
+        movies = fetch_movies(missing)
+    except Exception as e:
+        logger.warning("Erro ao buscar os detalhes dos filmes: %s", e)
+        return
+
+    Movie.upsert(session, [m for m in movies if m.get("Response") == "True"])
+    session.commit()
+
+
+def _load_watchlist(
+    watchlist: Watchlist,
+    fields: List[str] = None,
+    limit: int = None,
+    after: int = None,
+):
+    """Lê a lista e os detalhes dos seus filmes guardados na tabela movie.
+
+    Retorna a representação da lista sem os filmes, os ids dos filmes da
+    página na ordem da lista, os detalhes encontrados (apenas os campos
+    informados), os ids que faltam e se todos os detalhes encontrados
+    vieram da tabela movie. Apenas os filmes da página são lidos e,
+    portanto, buscados no OMDb.
+
+    Se todos os campos pedidos estiverem nas prévias dos filmes, os que
+    faltam na tabela são procurados nas prévias em cache e só os que não
+    estiverem nelas precisam ser buscados.
+    """
+    session = object_session(watchlist)
+
+    result = {
         "id": watchlist.id,
         "name": watchlist.name,
         "description": watchlist.description,
-        "movies": movies,
     }
 
+    # buscando os filmes da página junto dos seus detalhes
+    rows = (
+        session.query(AddedMovie.id, AddedMovie.imdb_id, Movie)
+        .outerjoin(Movie, Movie.imdb_id == AddedMovie.imdb_id)
+        .filter(AddedMovie.watchlist_id == watchlist.id)
+    )
+
+    if after is not None:
+        rows = rows.filter(AddedMovie.id > after)
+
+    # o item a mais indica que existe uma próxima página
+    rows = rows.order_by(AddedMovie.id).limit(
+        limit + 1 if limit else None
+    ).all()
+
+    if limit and len(rows) > limit:
+        del rows[limit:]
+        result["next"] = rows[-1][0]
+    else:
+        result["next"] = None
+
+    if limit or after is not None:
+        result["total"] = (
+            session.query(func.count(AddedMovie.id))
+            .filter(AddedMovie.watchlist_id == watchlist.id)
+            .scalar()
+        )
+    else:
+        result["total"] = len(rows)
+
+    imdb_ids = [imdb_id for _, imdb_id, _ in rows]
+    movies = {
+        imdb_id: movie.to_dict(fields)
+        for _, imdb_id, movie in rows
+        if movie
+    }
+    missing = [imdb_id for _, imdb_id, movie in rows if movie is None]
+    stored = True
+
+    if missing and fields and PREVIEW_FIELDS.issuperset(fields):
+        for imdb_id in missing:
+            preview = omdb_api.get_preview(imdb_id, fields)
+
+            if preview is not None:
+                movies[imdb_id] = preview
+                stored = False
+
+        missing = [imdb_id for imdb_id in missing if imdb_id not in movies]
+
+    return result, imdb_ids, movies, missing, stored
+
+
+def _not_fetched(imdb_id: str):
+    """Representação de um filme cujos detalhes ainda não foram buscados.
+
+    Segue o formato das respostas de erro do OMDb.
+    """
+    return {
+        "imdbID": imdb_id,
+        "Response": "False",
+        "Error": "Detalhes do filme ainda não buscados.",
+    }
+
+
+def _store_fetched(session, movies: dict, missing: List[str], fetched):
+    """Completa os detalhes com os filmes buscados e os guarda na base.
+
+    Retorna se todos os filmes foram buscados com sucesso e guardados.
+    """
+    movies.update(zip(missing, fetched))
+
+    found = [m for m in fetched if m.get("Response") == "True"]
+    Movie.upsert(session, found)
+    session.commit()
+
+    return len(found) == len(fetched)
+
+
+def render_watchlist(
+    watchlist: Watchlist,
+    fields: List[str] = None,
+    limit: int = None,
+    after: int = None,
+    fetch=fetch_movies,
+):
+    """Retorna uma representação da lista.
+
+    Segue o schema definido em WatchlistDetailsSchema. Os detalhes dos
+    filmes são lidos da tabela movie e apenas os filmes que ainda não estão
+    nela são buscados no OMDb, sendo guardados para as próximas exibições.
+    No máximo MOVIE_FETCH_LIMIT filmes são buscados por exibição; os demais
+    são representados como ainda não buscados.
+
+    Retorna também se todos os filmes da representação estão guardados na
+    base. Se não estiverem (erros do OMDb ou prévias em cache), ela pode
+    mudar sem que a versão da lista mude.
+
+    Arguments:
+        fields (optional): campos de cada filme; todos, se não informado.
+        limit (optional): quantidade de filmes; todos, se não informado.
+        after (optional): cursor da página, vindo do campo next.
+        fetch (optional): função que busca os filmes que faltam.
+    """
+    session = object_session(watchlist)
+    result, imdb_ids, movies, missing, stored = _load_watchlist(
+        watchlist, fields, limit, after
+    )
+
+    # devolvendo a conexão ao pool antes das requisições; os filmes
+    # buscados são guardados em uma nova transação
+    session.commit()
+
+    # os filmes além do limite ficam para as próximas exibições
+    fetch_limit = movie_fetch_limit()
+    if len(missing) > fetch_limit:
+        for imdb_id in missing[fetch_limit:]:
+            movies[imdb_id] = _not_fetched(imdb_id)
+
+        missing = missing[:fetch_limit]
+        stored = False
+
+    if missing:
+        fetched = fetch(missing)
+        stored = _store_fetched(session, movies, missing, fetched) and stored
+
+    result["movies"] = [
+        select_fields(movies[imdb_id], fields) for imdb_id in imdb_ids
+    ]
+
+    return result, stored
+
 
 class WatchlistAddMovieSchema(BaseModel):
     """Define como um filme a ser inserido deve ser."""
@@ -120,6 +480,39 @@ class WatchlistAddMovieSchema(BaseModel):
     )
 
 
+class WatchlistBulkAddSchema(BaseModel):
+    """Define a adição de vários filmes a várias listas de uma só vez."""
+
+    imdb_ids: List[str] = Field(
+        default=["tt0848228", "tt4154796"],
+        max_items=100,
+        description="IDs dos filmes no imdb, no máximo 100",
+    )
+    watchlist_ids: List[int] = Field(
+        default=[1],
+        max_items=20,
+        description="IDs das listas de filmes, no máximo 20",
+    )
+
+
+class WatchlistBulkAddResultSchema(BaseModel):
+    """Define o resultado da adição de um filme a uma lista.
+
+    O status pode ser added, already_added ou watchlist_not_found.
+    """
+
+    imdb_id: str = "tt0848228"
+    watchlist_id: int = 1
+    status: str = "added"
+
+
+class WatchlistBulkAddViewSchema(BaseModel):
+    """Define como o resultado de uma adição em lote será retornado."""
+
+    added: int = 1
+    results: List[WatchlistBulkAddResultSchema]
+
+
 class WatchlistRemoveMovieSchema(BaseModel):
     """Define como um filme a ser inserido deve ser."""
 
@@ -146,11 +539,20 @@ class MovieWatchlistsViewSchema(BaseModel):
     watchlists: List[int] = [1]
 
 
-def render_movie_watchlists(imdb_id, watchlists: List[Watchlist]):
-    """Retorna uma representação da lista segundo o MovieWatchlistsViewSchema."""
-    watchlist_ids = []
+def render_movie_watchlists(imdb_id, watchlist_ids: List[int]):
+    """Retorna uma representação segundo o MovieWatchlistsViewSchema."""
+    return {"imdb_id": imdb_id, "watchlists": list(watchlist_ids)}
 
-    for list in watchlists:
-        watchlist_ids.append(list.id)
 
-    return {"imdb_id": imdb_id, "watchlists": watchlist_ids}
+class MovieWatchlistsQuerySchema(BaseModel):
+    """Define a busca pelas listas de vários filmes de uma só vez."""
+
+    imdb_ids: List[str] = Field(
+        default=["tt0848228"], description="IDs dos filmes no imdb"
+    )
+
+
+class MovieWatchlistsListSchema(BaseModel):
+    """Define as listas que cada um dos filmes buscados pertence."""
+
+    movies: List[MovieWatchlistsViewSchema]
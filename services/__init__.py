@@ -1,2 +1,10 @@
-from services.mdb_api import MDbApi
-from services.top_100_api import Top100Api
+from services.http_client import (
+    AsyncHttpClient,
+    HttpClient,
+    async_http_client,
+    sync_http_client,
+)
+from services.single_flight import SingleFlight
+from services.mdb_api import MDbApi, omdb_api
+from services.top_100_api import Top100Api, top100_api
+from services.movie_refresher import MovieRefresher
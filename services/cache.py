@@ -0,0 +1,386 @@
+from collections import OrderedDict
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class MovieCache:
+    """Cache de dois níveis para respostas da API do OMDb.
+
+    O primeiro nível é um LRU limitado em memória e o segundo uma tabela
+    SQLite em disco, que sobrevive a reinícios do processo e é
+    compartilhada por todos os workers do host. Cada entrada expira após o
+    seu TTL; em memória, ela é mantida por no máximo memory_ttl segundos,
+    para que as atualizações feitas por outros workers sejam vistas.
+
+    Para que um filme buscado por um worker sirva aos demais, a busca de
+    cada chave é reservada na tabela movie_cache_lease: enquanto a reserva
+    existir, os outros workers aguardam o valor ser guardado em vez de
+    repetirem a requisição.
+    """
+
+    # número mínimo de escritas entre cada limpeza da tabela em disco
+    prune_interval = 100
+
+    # intervalo entre as consultas ao disco enquanto outro worker busca
+    # o valor aguardado, em segundos
+    poll_interval = 0.05
+
+    # idade mínima, em segundos, do último acesso registrado em disco para
+    # que uma leitura o atualize; assim a maioria das leituras não disputa
+    # o lock de escrita do SQLite
+    touch_interval = 300
+
+    def __init__(
+        self,
+        path: str,
+        ttl: int = 86400,
+        max_entries: int = 1024,
+        max_disk_entries: int = 100000,
+        memory_ttl: int = 60,
+        lease_timeout: float = 10,
+    ):
+        """Cria o cache.
+
+        Arguments:
+            path: caminho do arquivo SQLite do cache em disco.
+            ttl: tempo de vida padrão das entradas, em segundos.
+            max_entries: quantidade máxima de entradas em memória.
+            max_disk_entries: quantidade máxima de entradas em disco.
+            memory_ttl: tempo máximo de uma entrada em memória, em segundos.
+            lease_timeout: tempo máximo de uma reserva de busca, em
+                segundos; também é a espera máxima pelo valor reservado.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.memory_ttl = memory_ttl
+        self.lease_timeout = lease_timeout
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        # escritas desde a última limpeza
+        self._writes = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.wait_hits = 0
+        self.evictions = 0
+
+    def _connection(self):
+        """Abre a conexão com o banco do cache na primeira utilização.
+
+        Cada processo abre a sua conexão: a herdada do processo pai, após
+        um fork, não é usada.
+        """
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+
+            self._conn = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None
+            )
+            self._pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS movie_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_movie_cache_accessed_at"
+                " ON movie_cache (accessed_at)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS movie_cache_lease ("
+                " key TEXT PRIMARY KEY,"
+                " owner TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+
+        return self._conn
+
+    def _remember(self, key: str, value: dict, expires_at: float):
+        """Guarda uma entrada no LRU em memória, descartando a mais antiga."""
+        expires_at = min(expires_at, time.time() + self.memory_ttl)
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str):
+        """Retorna o valor em cache para a chave ou None se não houver."""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+
+                # entrada expirada
+                del self._memory[key]
+
+            value = self._read(key, now)
+
+            if value is None:
+                self.misses += 1
+            else:
+                self.disk_hits += 1
+
+            return value
+
+    def _read(self, key: str, now: float):
+        """Lê uma entrada do disco, guardando-a também em memória."""
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM movie_cache"
+            " WHERE key = ?",
+            (key,),
+        ).fetchone()
+
+        if row is None or row[1] <= now:
+            return None
+
+        value, expires_at, accessed_at = row
+
+        # o acesso só é registrado de tempos em tempos: a ordem aproximada
+        # basta para a remoção das entradas menos acessadas
+        if now - accessed_at >= self.touch_interval:
+            conn.execute(
+                "UPDATE movie_cache SET accessed_at = ? WHERE key = ?",
+                (now, key),
+            )
+
+        value = json.loads(value)
+        self._remember(key, value, expires_at)
+
+        return value
+
+    def set(self, key: str, value: dict, ttl: int = None):
+        """Guarda um valor no cache, nos dois níveis."""
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            self._remember(key, value, expires_at)
+
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO movie_cache"
+                " (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, now),
+            )
+
+            self._writes += 1
+            self._maybe_prune(now)
+
+    def set_many(self, values: dict, ttl: int = None):
+        """Guarda vários valores no cache, em uma única transação."""
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            for key, value in values.items():
+                self._remember(key, value, expires_at)
+
+            conn = self._connection()
+            conn.execute("BEGIN")
+
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO movie_cache"
+                    " (key, value, expires_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    [
+                        (key, json.dumps(value), expires_at, now)
+                        for key, value in values.items()
+                    ],
+                )
+                conn.execute("COMMIT")
+
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+            self._writes += len(values)
+            self._maybe_prune(now)
+
+    def _maybe_prune(self, now: float):
+        """Limpa o disco após prune_interval escritas desde a última."""
+        if self._writes >= self.prune_interval:
+            self._prune(now)
+            self._writes = 0
+
+    def _prune(self, now: float):
+        """Remove do disco as entradas expiradas e as menos acessadas.
+
+        A limpeza é feita em uma única transação, de modo que workers
+        limpando a tabela ao mesmo tempo não removem entradas a mais.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+
+        try:
+            conn.execute(
+                "DELETE FROM movie_cache WHERE expires_at <= ?", (now,)
+            )
+            conn.execute(
+                "DELETE FROM movie_cache_lease WHERE expires_at <= ?", (now,)
+            )
+            evicted = conn.execute(
+                "DELETE FROM movie_cache WHERE key IN ("
+                " SELECT key FROM movie_cache"
+                " ORDER BY accessed_at"
+                " LIMIT max(0, (SELECT COUNT(*) FROM movie_cache) - ?))",
+                (self.max_disk_entries,),
+            ).rowcount
+            conn.execute("COMMIT")
+
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        self.evictions += evicted
+
+    @staticmethod
+    def owner(task: asyncio.Task = None):
+        """Identifica quem reserva uma busca.
+
+        Por padrão, o processo e a thread atual. As corrotinas informam a
+        sua task, já que as operações do cache podem ser executadas por
+        threads diferentes.
+        """
+        ident = threading.get_ident() if task is None else f"task-{id(task)}"
+        return f"{os.getpid()}:{ident}"
+
+    def acquire(self, key: str, owner: str = None):
+        """Reserva a busca da chave para quem a chama.
+
+        Retorna False se a busca já estiver reservada por outro worker. A
+        reserva expira após lease_timeout segundos, caso quem a obteve
+        termine sem liberá-la.
+
+        Arguments:
+            owner (optional): quem reserva a busca; por padrão, o owner().
+        """
+        now = time.time()
+
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "DELETE FROM movie_cache_lease"
+                " WHERE key = ? AND expires_at <= ?",
+                (key, now),
+            )
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO movie_cache_lease"
+                " (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, owner or self.owner(), now + self.lease_timeout),
+            )
+
+            return cursor.rowcount == 1
+
+    def release(self, key: str, owner: str = None):
+        """Libera a reserva da busca feita por quem a chama."""
+        with self._lock:
+            self._connection().execute(
+                "DELETE FROM movie_cache_lease WHERE key = ? AND owner = ?",
+                (key, owner or self.owner()),
+            )
+
+    def _check(self, key: str):
+        """Verifica se o valor aguardado já está disponível.
+
+        Retorna (terminou, valor): a espera termina quando o valor é
+        guardado ou quando a reserva deixa de existir sem ele.
+        """
+        now = time.time()
+
+        with self._lock:
+            value = self._read(key, now)
+
+            if value is not None:
+                self.wait_hits += 1
+                return True, value
+
+            leased = self._connection().execute(
+                "SELECT 1 FROM movie_cache_lease"
+                " WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+
+            return leased is None, None
+
+    def wait(self, key: str):
+        """Aguarda o valor da busca reservada por outro worker.
+
+        Retorna None se a reserva for liberada sem guardar um valor (a
+        busca falhou ou o filme não existe) ou se a espera passar de
+        lease_timeout segundos.
+        """
+        deadline = time.monotonic() + self.lease_timeout
+
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            done, value = self._check(key)
+
+            if done:
+                return value
+
+        return None
+
+    async def wait_async(self, key: str):
+        """Versão assíncrona do wait.
+
+        As consultas ao disco são feitas em uma thread, sem bloquear o
+        event loop.
+        """
+        deadline = time.monotonic() + self.lease_timeout
+
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            done, value = await asyncio.to_thread(self._check, key)
+
+            if done:
+                return value
+
+        return None
+
+    def clear(self):
+        """Remove todas as entradas do cache."""
+        with self._lock:
+            self._memory.clear()
+            self._connection().execute("DELETE FROM movie_cache")
+            self._connection().execute("DELETE FROM movie_cache_lease")
+
+    def stats(self):
+        """Retorna os contadores de utilização do cache."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "wait_hits": self.wait_hits,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+            "hit_ratio": hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,365 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+from metrics import upstream_request_duration, upstream_requests
+
+
+class JitteredRetry(Retry):
+    """Política de retentativas com backoff exponencial e jitter.
+
+    O atraso de cada tentativa é sorteado entre zero e o backoff
+    exponencial calculado pelo urllib3, evitando que vários workers
+    repitam as requisições ao mesmo tempo.
+    """
+
+    def get_backoff_time(self):
+        """Retorna o tempo de espera até a próxima tentativa."""
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff else 0
+
+
+def record_request(service: str, url: str, status, started: float):
+    """Registra nas métricas uma requisição a uma API externa.
+
+    Arguments:
+        service: nome do serviço; se vazio, é usado o host da url.
+        status: status da resposta ou o nome da exceção lançada.
+        started: instante do início da requisição (time.monotonic).
+    """
+    service = service or urlparse(url).netloc
+
+    upstream_requests.inc(service=service, status=status)
+    upstream_request_duration.observe(
+        time.monotonic() - started, service=service
+    )
+
+
+def http_settings(**options):
+    """Retorna a configuração dos clientes HTTP.
+
+    Os parâmetros informados (e não nulos) têm precedência sobre as
+    variáveis HTTP_* da configuração.
+    """
+    settings = {
+        "pool_connections": config.get_int("HTTP_POOL_CONNECTIONS", 10),
+        "pool_maxsize": config.get_int("HTTP_POOL_MAXSIZE", 16),
+        "connect_timeout": config.get_float("HTTP_CONNECT_TIMEOUT", 3.05),
+        "read_timeout": config.get_float("HTTP_READ_TIMEOUT", 10),
+        "retries": config.get_int("HTTP_RETRIES", 3),
+        "backoff_factor": config.get_float("HTTP_BACKOFF_FACTOR", 0.3),
+    }
+    settings.update(
+        (name, value) for name, value in options.items() if value is not None
+    )
+
+    return settings
+
+
+class HttpClient:
+    """Cliente HTTP compartilhado pelos serviços externos.
+
+    Mantém um pool de conexões keep-alive por host, aplica timeouts de
+    conexão e leitura a todas as requisições e repete GETs que falharem
+    por erros de rede ou respostas 429/5xx.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = None,
+        pool_maxsize: int = None,
+        connect_timeout: float = None,
+        read_timeout: float = None,
+        retries: int = None,
+        backoff_factor: float = None,
+    ):
+        """Cria o cliente, sem ler a configuração nem abrir conexões.
+
+        Os parâmetros não informados são lidos da configuração na criação
+        da sessão, no primeiro uso de cada processo.
+
+        Arguments:
+            pool_connections: quantidade de hosts com pool mantido.
+            pool_maxsize: conexões mantidas abertas por host.
+            connect_timeout: tempo máximo para abrir a conexão, em segundos.
+            read_timeout: tempo máximo de espera pela resposta, em segundos.
+            retries: quantidade máxima de novas tentativas por requisição.
+            backoff_factor: fator do backoff exponencial entre tentativas.
+        """
+        self.options = {
+            "pool_connections": pool_connections,
+            "pool_maxsize": pool_maxsize,
+            "connect_timeout": connect_timeout,
+            "read_timeout": read_timeout,
+            "retries": retries,
+            "backoff_factor": backoff_factor,
+        }
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._session = None
+        self.adapter = None
+        self.timeout = None
+
+    @property
+    def session(self):
+        """Retorna a sessão do processo atual, criando-a se necessário.
+
+        Após um fork, as conexões abertas pelo processo pai não são usadas:
+        o processo filho cria a sua sessão e o seu pool.
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    settings = http_settings(**self.options)
+
+                    self.timeout = (
+                        settings["connect_timeout"],
+                        settings["read_timeout"],
+                    )
+                    self.adapter = HTTPAdapter(
+                        pool_connections=settings["pool_connections"],
+                        pool_maxsize=settings["pool_maxsize"],
+                        max_retries=JitteredRetry(
+                            total=settings["retries"],
+                            backoff_factor=settings["backoff_factor"],
+                            status_forcelist=(429, 500, 502, 503, 504),
+                            allowed_methods=frozenset(["GET"]),
+                            raise_on_status=False,
+                        ),
+                    )
+
+                    session = requests.Session()
+                    session.mount("http://", self.adapter)
+                    session.mount("https://", self.adapter)
+
+                    self._session = session
+                    self._pid = os.getpid()
+
+        return self._session
+
+    def get(self, url: str, service: str = None, **kwargs):
+        """Faz uma requisição GET usando o pool de conexões.
+
+        Arguments:
+            url: endereço da requisição.
+            service (optional): nome do serviço usado nas métricas.
+        """
+        session = self.session
+        kwargs.setdefault("timeout", self.timeout)
+        started = time.monotonic()
+
+        try:
+            response = session.get(url, **kwargs)
+
+        except requests.RequestException as e:
+            record_request(service, url, type(e).__name__, started)
+            raise
+
+        record_request(service, url, response.status_code, started)
+
+        return response
+
+    def stats(self):
+        """Retorna a utilização do pool de conexões de cada host."""
+        if self._pid != os.getpid():
+            return []
+
+        pools = self.adapter.poolmanager.pools
+        result = []
+
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+
+            # a fila do pool guarda None nas posições sem conexão aberta
+            queue = list(pool.pool.queue) if pool.pool else []
+
+            result.append(
+                {
+                    "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                    "connections_opened": pool.num_connections,
+                    "requests": pool.num_requests,
+                    "idle_connections": sum(c is not None for c in queue),
+                    "max_connections": pool.pool.maxsize if pool.pool else 0,
+                }
+            )
+
+        return result
+
+
+class AsyncHttpClient:
+    """Cliente HTTP assíncrono compartilhado pelos serviços externos.
+
+    As requisições rodam em um único event loop, mantido em uma thread em
+    segundo plano, de modo que várias esperas pelas APIs se sobrepõem sem
+    ocupar uma thread cada. O pool de conexões keep-alive do httpx é
+    compartilhado por todas elas.
+
+    Apenas a espera pelas APIs deve rodar no event loop: qualquer trabalho
+    bloqueante (banco, cache em disco) feito nele atrasa todas as demais
+    requisições do processo.
+
+    Assim como o HttpClient, repete os GETs que falharem por erros de rede
+    ou respostas 429/5xx, com backoff exponencial e jitter.
+    """
+
+    # status das respostas que são repetidas
+    retry_statuses = frozenset((429, 500, 502, 503, 504))
+
+    def __init__(
+        self,
+        pool_maxsize: int = None,
+        connect_timeout: float = None,
+        read_timeout: float = None,
+        retries: int = None,
+        backoff_factor: float = None,
+    ):
+        """Cria o cliente, sem ler a configuração nem iniciar o event loop.
+
+        Os parâmetros não informados são lidos da configuração na criação
+        do cliente do httpx, na primeira requisição de cada processo.
+
+        Arguments:
+            pool_maxsize: conexões mantidas abertas por host.
+            connect_timeout: tempo máximo para abrir a conexão, em segundos.
+            read_timeout: tempo máximo de espera pela resposta, em segundos.
+            retries: quantidade máxima de novas tentativas por requisição.
+            backoff_factor: fator do backoff exponencial entre tentativas.
+        """
+        self.options = {
+            "pool_maxsize": pool_maxsize,
+            "connect_timeout": connect_timeout,
+            "read_timeout": read_timeout,
+            "retries": retries,
+            "backoff_factor": backoff_factor,
+        }
+        self.retries = None
+        self.backoff_factor = None
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self._client = None
+
+    @property
+    def loop(self):
+        """Retorna o event loop do cliente, iniciando-o se necessário.
+
+        Após um fork, a thread do event loop do processo pai não existe no
+        processo filho, que inicia o seu próprio event loop e cliente.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+
+                threading.Thread(
+                    target=loop.run_forever, name="async-http", daemon=True
+                ).start()
+
+                self._loop = loop
+                self._client = None
+                self._pid = os.getpid()
+
+        return self._loop
+
+    def run(self, coroutine):
+        """Executa a corrotina no event loop do cliente e aguarda o resultado.
+
+        A corrotina enxerga o mesmo contexto (contextvars) de quem a chamou,
+        incluindo o contexto da requisição do Flask.
+        """
+        context = contextvars.copy_context()
+        future = asyncio.run_coroutine_threadsafe(
+            self._in_context(coroutine, context), self.loop
+        )
+
+        return future.result()
+
+    @staticmethod
+    async def _in_context(coroutine, context):
+        """Executa a corrotina em uma task com o contexto informado."""
+        return await asyncio.get_running_loop().create_task(
+            coroutine, context=context
+        )
+
+    def backoff(self, attempt: int):
+        """Retorna a espera antes da nova tentativa, em segundos.
+
+        Segue o backoff do JitteredRetry: a primeira nova tentativa é
+        imediata e as seguintes esperam um tempo sorteado entre zero e o
+        backoff exponencial.
+        """
+        if attempt == 0:
+            return 0
+
+        return random.uniform(0, self.backoff_factor * 2 ** attempt)
+
+    async def get(self, url: str, service: str = None, **kwargs):
+        """Faz uma requisição GET usando o pool de conexões.
+
+        Arguments:
+            url: endereço da requisição.
+            service (optional): nome do serviço usado nas métricas.
+        """
+        if self._client is None:
+            settings = http_settings(**self.options)
+            self.retries = settings["retries"]
+            self.backoff_factor = settings["backoff_factor"]
+
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(
+                    settings["read_timeout"],
+                    connect=settings["connect_timeout"],
+                ),
+                transport=httpx.AsyncHTTPTransport(
+                    limits=httpx.Limits(
+                        max_connections=settings["pool_maxsize"],
+                        max_keepalive_connections=settings["pool_maxsize"],
+                    )
+                ),
+            )
+
+        started = time.monotonic()
+
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+
+            try:
+                response = await self._client.get(url, **kwargs)
+
+            except httpx.TransportError as e:
+                if last:
+                    record_request(service, url, type(e).__name__, started)
+                    raise
+
+            except httpx.HTTPError as e:
+                record_request(service, url, type(e).__name__, started)
+                raise
+
+            else:
+                if last or response.status_code not in self.retry_statuses:
+                    break
+
+            await asyncio.sleep(self.backoff(attempt))
+
+        record_request(service, url, response.status_code, started)
+
+        return response
+
+
+# clientes únicos, compartilhados por todos os serviços; a configuração é
+# lida no primeiro uso
+sync_http_client = HttpClient()
+async_http_client = AsyncHttpClient()
@@ -1,23 +1,246 @@
-import requests
-from dotenv import dotenv_values
+from urllib.parse import urlencode
+import asyncio
+import threading
+
+import config
+from services.cache import MovieCache
+from services.http_client import async_http_client, sync_http_client
+from services.single_flight import SingleFlight
 
 
 class MDbApi:
-    # carrega a chave da MDbApi
-    api_key = dotenv_values(".env")["API_KEY"]
+    """Cliente da API do OMDb.
+
+    A configuração é lida e o cache é criado na primeira utilização, e não
+    na importação do módulo.
+
+    Nas versões assíncronas, que rodam no event loop do cliente HTTP, as
+    operações do cache (SQLite) são executadas em threads, para não
+    bloquear o event loop.
+    """
+
+    # cache dos detalhes dos filmes, compartilhado entre as instâncias
+    _cache = None
+    _cache_lock = threading.Lock()
+
+    # agrupa as buscas simultâneas pelos mesmos filmes
+    flight = SingleFlight()
+
+    @property
+    def base_url(self):
+        """Endereço da API, que pode apontar para um substituto local."""
+        return config.get_str("OMDB_URL", "https://www.omdbapi.com")
+
+    @property
+    def api_key(self):
+        """Chave da MDbApi."""
+        return config.get_str("API_KEY")
+
+    @property
+    def cache(self):
+        """Cache dos detalhes dos filmes, criado na primeira utilização."""
+        if MDbApi._cache is None:
+            with MDbApi._cache_lock:
+                if MDbApi._cache is None:
+                    MDbApi._cache = MovieCache(
+                        path=config.get_str(
+                            "MOVIE_CACHE_PATH", "database/cache.sqlite3"
+                        ),
+                        ttl=config.get_int("MOVIE_CACHE_TTL", 86400),
+                        max_entries=config.get_int(
+                            "MOVIE_CACHE_MAX_ENTRIES", 1024
+                        ),
+                        max_disk_entries=config.get_int(
+                            "MOVIE_CACHE_MAX_DISK_ENTRIES", 100000
+                        ),
+                        memory_ttl=config.get_int(
+                            "MOVIE_CACHE_MEMORY_TTL", 60
+                        ),
+                        lease_timeout=config.get_float(
+                            "MOVIE_CACHE_LEASE_TIMEOUT", 10
+                        ),
+                    )
+
+        return MDbApi._cache
 
     def get_movies(self, query: dict):
-        """Faz uma busca na API do OMDb."""
+        """Faz uma busca na API do OMDb.
+
+        As respostas de sucesso são guardadas em cache pelo tempo definido
+        em MOVIE_SEARCH_CACHE_TTL e buscas simultâneas com os mesmos
+        parâmetros compartilham uma única requisição.
+        """
+        key, params = self._search_params(query)
+
+        movies = self.cache.get(key)
+        if movies is not None:
+            return movies
+
+        return self.flight.do(
+            key, self._fetch, key, params, self.search_ttl
+        )
+
+    async def get_movies_async(self, query: dict):
+        """Versão assíncrona do get_movies."""
+        key, params = self._search_params(query)
+
+        movies = await asyncio.to_thread(self.cache.get, key)
+        if movies is not None:
+            return movies
+
+        return await self.flight.do_async(
+            key, self._fetch_async, key, params, self.search_ttl
+        )
+
+    @property
+    def search_ttl(self):
+        """Tempo de vida das buscas em cache, em segundos."""
+        return config.get_int("MOVIE_SEARCH_CACHE_TTL", 3600)
+
+    def _search_params(self, query: dict):
+        """Retorna a chave do cache e os parâmetros de uma busca."""
+        # os parâmetros vazios não são enviados para a API
+        params = {k: v for k, v in query.items() if v is not None}
+        key = "search?" + urlencode(sorted(params.items()))
+
+        # adiciona a chave da MDbApi
+        params["apikey"] = self.api_key
+
+        return key, params
+
+    def remember_previews(self, movies: list):
+        """Guarda em cache as prévias dos filmes de um resultado de busca.
+
+        As prévias (título, ano, pôster...) atendem às requisições que
+        pedem apenas esses campos, sem buscar os detalhes dos filmes.
+        """
+        previews = {
+            f"preview:{movie['imdbID']}": movie
+            for movie in movies
+            if isinstance(movie, dict) and movie.get("imdbID")
+        }
+
+        if previews:
+            self.cache.set_many(previews)
+
+    def get_preview(self, imdb_id: str, fields: list):
+        """Retorna o filme em cache se ele tiver todos os campos informados.
+
+        Procura os detalhes do filme e, se não estiverem em cache, a prévia
+        vinda de uma busca. Retorna None se nenhum deles atender aos
+        campos; nenhuma requisição é feita à API.
+        """
+        for key in (imdb_id, f"preview:{imdb_id}"):
+            movie = self.cache.get(key)
+
+            if movie is not None and all(name in movie for name in fields):
+                return movie
+
+        return None
+
+    def _get(self, params: dict):
+        """Faz a requisição à API do OMDb."""
+        return sync_http_client.get(
+            self.base_url, service="omdb", params=params
+        ).json()
+
+    async def _get_async(self, params: dict):
+        """Faz a requisição assíncrona à API do OMDb."""
+        response = await async_http_client.get(
+            self.base_url, service="omdb", params=params
+        )
+        return response.json()
+
+    def _fetch(self, key: str, params: dict, ttl: int = None):
+        """Faz a requisição à API e guarda a resposta em cache.
+
+        Se outro worker já estiver buscando a mesma chave, aguarda a
+        resposta que ele guardar no cache compartilhado e só faz a
+        requisição se ela não vier.
+        """
+        leased = self.cache.acquire(key)
+
+        try:
+            if not leased:
+                value = self.cache.wait(key)
+                if value is not None:
+                    return value
+
+            value = self._get(params)
+
+            # apenas as respostas de sucesso são guardadas em cache
+            if value.get("Response") == "True":
+                self._store(key, value, ttl)
+
+            return value
+
+        finally:
+            if leased:
+                self.cache.release(key)
+
+    async def _fetch_async(self, key: str, params: dict, ttl: int = None):
+        """Versão assíncrona do _fetch."""
+        owner = self.cache.owner(asyncio.current_task())
+        leased = await asyncio.to_thread(self.cache.acquire, key, owner)
+
+        try:
+            if not leased:
+                value = await self.cache.wait_async(key)
+                if value is not None:
+                    return value
+
+            value = await self._get_async(params)
+
+            # apenas as respostas de sucesso são guardadas em cache
+            if value.get("Response") == "True":
+                await asyncio.to_thread(self._store, key, value, ttl)
+
+            return value
+
+        finally:
+            if leased:
+                await asyncio.to_thread(self.cache.release, key, owner)
+
+    def _store(self, key: str, value: dict, ttl: int = None):
+        """Guarda em cache a resposta e as prévias dos filmes buscados."""
+        self.cache.set(key, value, ttl)
+        self.remember_previews(value.get("Search", []))
+
+    def get_movie_by_id(self, imdb_id: str, refresh: bool = False):
+        """Faz uma busca na API do OMDb.
+
+        As respostas de sucesso são guardadas em cache pelo tempo definido
+        em MOVIE_CACHE_TTL e buscas simultâneas pelo mesmo filme, em
+        qualquer worker, compartilham uma única requisição.
+
+        Arguments:
+            imdb_id: id do filme no imdb.
+            refresh (optional): ignora o cache e busca o filme na API.
+        """
+        if not refresh:
+            movie = self.cache.get(imdb_id)
+            if movie is not None:
+                return movie
 
         # adiciona a chave da MDbApi
-        query["apikey"] = self.api_key
+        params = {"apikey": self.api_key, "i": imdb_id}
 
-        return requests.get(f"https://www.omdbapi.com", params=query).json()
+        return self.flight.do(imdb_id, self._fetch, imdb_id, params)
 
-    def get_movie_by_id(self, imdb_id: str):
-        """Faz uma busca na API do OMDb."""
+    async def get_movie_by_id_async(self, imdb_id: str, refresh: bool = False):
+        """Versão assíncrona do get_movie_by_id."""
+        if not refresh:
+            movie = await asyncio.to_thread(self.cache.get, imdb_id)
+            if movie is not None:
+                return movie
 
         # adiciona a chave da MDbApi
-        query = {"apikey": self.api_key, "i": imdb_id}
+        params = {"apikey": self.api_key, "i": imdb_id}
+
+        return await self.flight.do_async(
+            imdb_id, self._fetch_async, imdb_id, params
+        )
+
 
-        return requests.get(f"https://www.omdbapi.com", params=query).json()
+# cliente único, compartilhado pelas rotas e pela atualização dos filmes
+omdb_api = MDbApi()
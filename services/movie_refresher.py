@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta
+import os
+import threading
+
+import config
+from logger import logger
+from models import Session, Movie
+
+
+class MovieRefresher:
+    """Atualiza periodicamente os detalhes dos filmes da tabela movie.
+
+    A cada intervalo, os filmes atualizados há mais tempo que a idade
+    máxima são buscados novamente no OMDb, em lotes.
+    """
+
+    def __init__(
+        self,
+        mdb_api,
+        interval: int = None,
+        max_age: int = None,
+        batch_size: int = None,
+    ):
+        """Cria o atualizador.
+
+        Os parâmetros não informados são lidos da configuração na primeira
+        utilização.
+
+        Arguments:
+            mdb_api: cliente da API do OMDb.
+            interval (optional): tempo entre as atualizações, em segundos.
+            max_age (optional): idade a partir da qual um filme é atualizado.
+            batch_size (optional): quantidade máxima de filmes por vez.
+        """
+        self.mdb_api = mdb_api
+        self._interval = interval
+        self._max_age = max_age
+        self._batch_size = batch_size
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def interval(self):
+        """Tempo entre as atualizações, em segundos (0 desativa)."""
+        if self._interval is None:
+            self._interval = config.get_int("MOVIE_REFRESH_INTERVAL", 3600)
+
+        return self._interval
+
+    @property
+    def max_age(self):
+        """Idade, em segundos, a partir da qual um filme é atualizado."""
+        if self._max_age is None:
+            self._max_age = config.get_int("MOVIE_REFRESH_MAX_AGE", 604800)
+
+        return self._max_age
+
+    @property
+    def batch_size(self):
+        """Quantidade máxima de filmes atualizados por vez."""
+        if self._batch_size is None:
+            self._batch_size = config.get_int("MOVIE_REFRESH_BATCH_SIZE", 100)
+
+        return self._batch_size
+
+    def refresh_stale(self):
+        """Atualiza os filmes desatualizados e retorna quantos foram.
+
+        A tentativa é registrada também nos filmes cuja busca falhou, que
+        só são buscados de novo quando ficarem desatualizados outra vez.
+        Assim, eles não ocupam sempre o início do lote.
+        """
+        now = datetime.now()
+        threshold = now - timedelta(seconds=self.max_age)
+        session = Session()
+
+        try:
+            imdb_ids = [
+                imdb_id
+                for (imdb_id,) in session.query(Movie.imdb_id)
+                .filter(Movie.updated_at < threshold)
+                .order_by(Movie.updated_at)
+                .limit(self.batch_size)
+            ]
+
+            # devolvendo a conexão ao pool antes das requisições
+            session.commit()
+
+            movies = []
+            failed = []
+
+            for imdb_id in imdb_ids:
+                movie = self._fetch(imdb_id)
+
+                if movie is not None and movie.get("Response") == "True":
+                    movies.append(movie)
+                else:
+                    failed.append(imdb_id)
+
+            # as listas com os filmes atualizados mudam de versão,
+            # invalidando os ETags já enviados aos clientes
+            Movie.upsert(session, movies)
+
+            if failed:
+                session.query(Movie).filter(
+                    Movie.imdb_id.in_(failed)
+                ).update({Movie.updated_at: now}, synchronize_session=False)
+
+            session.commit()
+
+            return len(movies)
+
+        finally:
+            Session.remove()
+
+    def _fetch(self, imdb_id: str):
+        """Busca o filme no OMDb, retornando None em caso de erro."""
+        try:
+            return self.mdb_api.get_movie_by_id(imdb_id, refresh=True)
+
+        except Exception as e:
+            logger.warning("Erro ao atualizar o filme %s: %s", imdb_id, e)
+            return None
+
+    def start(self):
+        """Inicia a atualização periódica em uma thread em segundo plano.
+
+        A thread é iniciada uma vez por processo: após um fork, a thread do
+        processo pai não existe no processo filho.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="movie-refresher", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Interrompe a atualização periódica."""
+        self._stop.set()
+
+    def _run(self):
+        """Executa as atualizações até que o atualizador seja interrompido."""
+        while not self._stop.wait(self.interval):
+            try:
+                count = self.refresh_stale()
+                logger.info("%d filmes atualizados a partir do OMDb", count)
+
+            except Exception as e:
+                logger.warning("Erro ao atualizar os filmes: %s", e)
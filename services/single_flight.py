@@ -0,0 +1,95 @@
+import asyncio
+import threading
+
+
+class _Call:
+    """Representa uma chamada em andamento."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Agrupa chamadas simultâneas para uma mesma chave.
+
+    Enquanto uma chamada está em andamento, as demais chamadas com a mesma
+    chave aguardam o seu término e recebem o mesmo resultado (ou a mesma
+    exceção), em vez de repetirem a requisição.
+    """
+
+    def __init__(self):
+        """Cria o agrupador de chamadas."""
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+
+        self.executed = 0
+        self.merged = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """Executa fn uma única vez para as chamadas simultâneas da chave."""
+        with self._lock:
+            call = self._calls.get(key)
+
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+            else:
+                self.merged += 1
+                leader = False
+
+        if not leader:
+            # aguarda a chamada em andamento
+            call.done.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+
+        except Exception as e:
+            call.error = e
+            raise
+
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+            call.done.set()
+
+    async def do_async(self, key, fn, *args, **kwargs):
+        """Executa a corrotina fn uma única vez para as chamadas simultâneas.
+
+        Todas as chamadas devem ser feitas no mesmo event loop e aguardam a
+        mesma task.
+        """
+        task = self._tasks.get(key)
+
+        with self._lock:
+            if task is None:
+                self.executed += 1
+            else:
+                self.merged += 1
+
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+
+        # o shield evita que o cancelamento de quem aguarda cancele a task
+        return await asyncio.shield(task)
+
+    def stats(self):
+        """Retorna os contadores de chamadas executadas e agrupadas."""
+        return {
+            "executed": self.executed,
+            "merged": self.merged,
+            "in_flight": len(self._calls) + len(self._tasks),
+        }
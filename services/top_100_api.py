@@ -1,5 +1,14 @@
-import requests
+from datetime import datetime
+import asyncio
 import os
+import threading
+import time
+
+import config
+from logger import logger
+from services.http_client import async_http_client, sync_http_client
+from services.mdb_api import omdb_api
+from services.single_flight import SingleFlight
 
 
 def is_docker():
@@ -12,14 +21,191 @@ def is_docker():
     )
 
 
+def resolve_host():
+    """Retorna o endereço do serviço de scraping do top 100."""
+    host = "http://localhost"
+
+    if is_docker():
+        host = "http://host.docker.internal"
+
+    return host
+
+
 class Top100Api:
-    """API do iMBD Scraper."""
+    """API do iMBD Scraper.
+
+    A lista do top 100 muda raramente, então a última resposta válida é
+    mantida como um snapshot. Quando o snapshot passa de TOP100_MAX_AGE
+    segundos ele continua sendo servido enquanto uma thread em segundo
+    plano busca a nova versão; se o serviço estiver fora do ar, o snapshot
+    antigo segue em uso.
+    """
+
+    def __init__(self, url: str = None, max_age: int = None):
+        """Cria o cliente.
+
+        O endereço do serviço e a idade máxima, quando não informados, são
+        lidos da configuração na primeira utilização.
+
+        Arguments:
+            url (optional): endereço da rota de filmes do serviço.
+            max_age (optional): idade máxima do snapshot, em segundos.
+        """
+        self._url = url
+        self._max_age = max_age
+
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._snapshot = None
+        self._refreshed_at = None
+        self._refreshing = False
+        self.last_error = None
+
+    @property
+    def url(self):
+        """Endereço do serviço, resolvido uma única vez."""
+        if self._url is None:
+            self._url = config.get_str(
+                "TOP100_URL", f"{resolve_host()}:5001/movies"
+            )
+
+        return self._url
+
+    @property
+    def max_age(self):
+        """Idade máxima do snapshot, em segundos."""
+        if self._max_age is None:
+            self._max_age = config.get_int("TOP100_MAX_AGE", 3600)
+
+        return self._max_age
+
+    def cached_movies(self):
+        """Retorna o snapshot, sem esperar por nenhuma busca.
+
+        Se o snapshot estiver velho, a nova versão é buscada em segundo
+        plano. Retorna None se ainda não houver snapshot.
+        """
+        snapshot = self._snapshot
+
+        if snapshot is not None and self.age() > self.max_age:
+            self._refresh_in_background()
+
+        return snapshot
 
     def get_movies(self):
         """Busca todos os filmes do top 100."""
-        host = "http://localhost"
+        snapshot = self.cached_movies()
+
+        if snapshot is None:
+            # ainda não há snapshot: a busca é feita na própria requisição
+            return self._flight.do("top100", self.refresh)
+
+        return snapshot
+
+    async def get_movies_async(self):
+        """Versão assíncrona do get_movies."""
+        snapshot = self.cached_movies()
+
+        if snapshot is None:
+            return await self._flight.do_async("top100", self.refresh_async)
+
+        return snapshot
+
+    def refresh(self):
+        """Busca a lista no serviço e atualiza o snapshot."""
+        started = time.monotonic()
+
+        response = sync_http_client.get(self.url, service="top100")
+        response.raise_for_status()
+
+        return self._store(response.json(), started)
+
+    async def refresh_async(self):
+        """Versão assíncrona do refresh.
+
+        O snapshot é guardado em uma thread, já que as prévias dos filmes
+        são escritas no cache em disco.
+        """
+        started = time.monotonic()
+
+        response = await async_http_client.get(
+            self.url, service="top100"
+        )
+        response.raise_for_status()
+
+        return await asyncio.to_thread(
+            self._store, response.json(), started
+        )
+
+    def _store(self, movies, started: float):
+        """Guarda a lista buscada como o novo snapshot."""
+        with self._lock:
+            self._snapshot = movies
+            self._refreshed_at = time.time()
+            self.last_error = None
+
+        # as prévias dos filmes atendem às requisições de poucos campos
+        if isinstance(movies, dict):
+            omdb_api.remember_previews(movies.get("Search", []))
+
+        logger.info(
+            "Top 100 atualizado em %.3fs", time.monotonic() - started
+        )
+
+        return movies
+
+    def _refresh_in_background(self):
+        """Atualiza o snapshot em uma thread, se já não houver uma ativa."""
+        with self._lock:
+            if self._refreshing:
+                return
+
+            self._refreshing = True
+
+        threading.Thread(
+            target=self._background_refresh,
+            name="top100-refresh",
+            daemon=True,
+        ).start()
+
+    def _background_refresh(self):
+        """Atualiza o snapshot, mantendo o antigo em caso de erro."""
+        try:
+            self.refresh()
+
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning("Erro ao atualizar o top 100: %s", e)
+
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def age(self):
+        """Retorna a idade do snapshot em segundos ou None se não houver."""
+        if self._refreshed_at is None:
+            return None
+
+        return time.time() - self._refreshed_at
+
+    def refreshed_at(self):
+        """Retorna a data da última atualização do snapshot."""
+        if self._refreshed_at is None:
+            return None
+
+        return datetime.fromtimestamp(self._refreshed_at)
+
+    def stats(self):
+        """Retorna o estado atual do snapshot."""
+        refreshed_at = self.refreshed_at()
+
+        return {
+            "age": self.age(),
+            "refreshed_at": refreshed_at.isoformat() if refreshed_at else None,
+            "refreshing": self._refreshing,
+            "last_error": self.last_error,
+        }
 
-        if is_docker():
-            host = "http://host.docker.internal"
 
-        return requests.get(f"{host}:5001/movies").json()
+# cliente único, compartilhado pelas rotas e pelas métricas
+top100_api = Top100Api()
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+import config
+
+
+@pytest.fixture(scope="session", autouse=True)
+def workdir(tmp_path_factory):
+    """Executa os testes em um diretório temporário.
+
+    O banco, o cache e os logs são criados no diretório atual, então os
+    testes não tocam nos arquivos do projeto.
+    """
+    path = tmp_path_factory.mktemp("app")
+    (path / ".env").write_text("API_KEY=test\n")
+
+    cwd = os.getcwd()
+    os.chdir(path)
+    config.load()
+
+    yield path
+
+    os.chdir(cwd)
+
+
+@pytest.fixture
+def session():
+    """Sessão com o banco, removida ao fim do teste."""
+    from models import Session
+
+    yield Session()
+
+    Session.remove()
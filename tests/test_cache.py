@@ -0,0 +1,64 @@
+import threading
+
+from services.cache import MovieCache
+from services.single_flight import SingleFlight
+
+
+def test_lease_is_held_until_released_by_its_owner(tmp_path):
+    cache = MovieCache(str(tmp_path / "cache.sqlite3"))
+
+    assert cache.acquire("tt1", owner="a")
+    assert not cache.acquire("tt1", owner="b")
+
+    # apenas quem reservou a busca pode liberá-la
+    cache.release("tt1", owner="b")
+    assert not cache.acquire("tt1", owner="b")
+
+    cache.release("tt1", owner="a")
+    assert cache.acquire("tt1", owner="b")
+
+
+def test_single_flight_merges_concurrent_calls():
+    flight = SingleFlight()
+    started = threading.Event()
+    finish = threading.Event()
+    results = []
+
+    def fetch():
+        started.set()
+        finish.wait(5)
+        return {"imdbID": "tt1"}
+
+    def call():
+        results.append(flight.do("tt1", fetch))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+
+    followers = [threading.Thread(target=call) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+
+    # os seguidores já aguardam a chamada em andamento
+    while flight.merged < 3:
+        threading.Event().wait(0.01)
+
+    finish.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert flight.executed == 1
+    assert results == [{"imdbID": "tt1"}] * 4
+
+
+def test_set_many_prunes_the_disk(tmp_path):
+    cache = MovieCache(str(tmp_path / "cache.sqlite3"), max_disk_entries=5)
+    cache.prune_interval = 10
+
+    # cada lote passa do intervalo sem cair em um múltiplo dele
+    cache.set_many({f"a{i}": {} for i in range(7)})
+    assert cache.evictions == 0
+
+    cache.set_many({f"b{i}": {} for i in range(7)})
+    assert cache.evictions == 9
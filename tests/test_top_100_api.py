@@ -0,0 +1,18 @@
+from services.top_100_api import Top100Api
+
+
+def test_cached_movies_refreshes_a_stale_snapshot_in_background():
+    api = Top100Api(url="http://localhost:1/movies", max_age=60)
+    assert api.cached_movies() is None
+
+    refreshes = []
+    api._refresh_in_background = lambda: refreshes.append(1)
+    api._store({"Search": []}, 0)
+
+    assert api.cached_movies() == {"Search": []}
+    assert refreshes == []
+
+    # o snapshot velho continua sendo servido
+    api._refreshed_at -= 61
+    assert api.cached_movies() == {"Search": []}
+    assert refreshes == [1]
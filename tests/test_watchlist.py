@@ -0,0 +1,73 @@
+import models
+from models import AddedMovie, Movie, Watchlist
+from schemas import watchlist as schemas
+
+
+def movie(imdb_id):
+    """Resposta do OMDb para o filme informado."""
+    return {
+        "Title": "Filme " + imdb_id,
+        "Year": "2000",
+        "imdbID": imdb_id,
+        "Response": "True",
+    }
+
+
+def create_watchlist(session, name, imdb_ids):
+    """Cria uma lista com os filmes informados."""
+    watchlist = Watchlist(name=name, description="")
+    watchlist.movies = [AddedMovie(imdb_id) for imdb_id in imdb_ids]
+    session.add(watchlist)
+    session.commit()
+    return watchlist
+
+
+def test_render_watchlist_fetches_without_connection(session):
+    watchlist = create_watchlist(session, "render", ["tt101", "tt102"])
+    checked_out = []
+
+    def fetch(imdb_ids):
+        checked_out.append(models.engine.pool.checkedout())
+        return [movie(imdb_id) for imdb_id in imdb_ids]
+
+    result, stored = schemas.render_watchlist(watchlist, fetch=fetch)
+
+    assert checked_out == [0]
+    assert stored
+    assert [m["imdbID"] for m in result["movies"]] == ["tt101", "tt102"]
+    assert session.query(Movie).filter(
+        Movie.imdb_id.in_(["tt101", "tt102"])
+    ).count() == 2
+
+
+def test_store_movies_fetches_without_connection(session, monkeypatch):
+    checked_out = []
+
+    def fetch(imdb_ids):
+        checked_out.append(models.engine.pool.checkedout())
+        return [movie(imdb_id) for imdb_id in imdb_ids]
+
+    monkeypatch.setattr(schemas, "fetch_movies", fetch)
+    schemas.store_movies(session, ["tt201"])
+
+    assert checked_out == [0]
+    assert session.query(Movie).filter(Movie.imdb_id == "tt201").count() == 1
+
+
+def test_render_watchlist_fetches_at_most_the_limit(session, monkeypatch):
+    watchlist = create_watchlist(session, "limit", ["tt301", "tt302"])
+    monkeypatch.setattr(schemas, "movie_fetch_limit", lambda: 1)
+
+    def fetch(imdb_ids):
+        return [movie(imdb_id) for imdb_id in imdb_ids]
+
+    result, stored = schemas.render_watchlist(watchlist, fetch=fetch)
+
+    assert not stored
+    assert [m["Response"] for m in result["movies"]] == ["True", "False"]
+
+    # o filme que passou do limite é buscado na exibição seguinte
+    result, stored = schemas.render_watchlist(watchlist, fetch=fetch)
+
+    assert stored
+    assert [m["Response"] for m in result["movies"]] == ["True", "True"]